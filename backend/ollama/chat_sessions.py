@@ -0,0 +1,160 @@
+# backend/ollama/chat_sessions.py
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Sessions kept in memory, how long an unused session survives, and the total number of
+# Ollama context tokens all sessions may hold. Sessions past any limit are evicted LRU.
+CHAT_SESSIONS_MAX = int(os.getenv("MANDIAO_CHAT_SESSIONS_MAX", "256"))
+CHAT_SESSION_IDLE_TIMEOUT = float(os.getenv("MANDIAO_CHAT_SESSION_IDLE_TIMEOUT", "1800"))
+CHAT_SESSIONS_MAX_TOKENS = int(os.getenv("MANDIAO_CHAT_SESSIONS_MAX_TOKENS", "2000000"))
+# A session whose context grows beyond this many tokens drops it; the next turn starts a
+# fresh context from the last MAX_HISTORY_TURNS turns of text history instead.
+SESSION_MAX_CONTEXT_TOKENS = int(os.getenv("MANDIAO_SESSION_MAX_CONTEXT_TOKENS", "8192"))
+MAX_HISTORY_TURNS = 6
+
+class ChatSession:
+    def __init__(self, session_id: str, model: str):
+        self.id = session_id
+        self.model = model
+        self.context = None  # int32 token array returned by Ollama at the end of the last turn
+        self.turns = []  # [{"user", "assistant", "at"}]
+        self.sent_chunks = set()  # ids of chunks already inside self.context
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self.busy = False
+        self.checkouts = 0  # identifies the turn in progress, so a late checkin cannot end a newer one
+
+    @property
+    def context_tokens(self) -> int:
+        return 0 if self.context is None else len(self.context)
+
+    def history(self, turns: int = MAX_HISTORY_TURNS) -> list:
+        return [(turn["user"], turn["assistant"]) for turn in self.turns[-turns:]]
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.id,
+            "model": self.model,
+            "turns": [{"user": turn["user"], "assistant": turn["assistant"], "at": turn["at"]}
+                      for turn in self.turns],
+            "context_tokens": self.context_tokens,
+            "created_at": self.created_at
+        }
+
+class ChatSessionStore:
+    """
+    In-process chat sessions keyed by session id. Each keeps its turn history and the
+    `context` token array from Ollama's final stream message, so a follow-up question only
+    sends its new tokens. Memory is bounded by session count and total context tokens.
+    """
+
+    def __init__(self, max_sessions: int = CHAT_SESSIONS_MAX, idle_timeout: float = CHAT_SESSION_IDLE_TIMEOUT,
+                 max_tokens: int = CHAT_SESSIONS_MAX_TOKENS):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_tokens = max_tokens
+        self.evictions = 0
+        self.expirations = 0
+        self.context_resets = 0
+        self._sessions = OrderedDict()  # id -> ChatSession, least recently used first
+        self._lock = threading.Lock()
+
+    def _total_tokens(self) -> int:
+        return sum(session.context_tokens for session in self._sessions.values())
+
+    def _evict(self):
+        """Drops idle sessions, then LRU sessions while over the limits; call with the lock held."""
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self._sessions.items()
+                           if not s.busy and now - s.last_used > self.idle_timeout]:
+            del self._sessions[session_id]
+            self.expirations += 1
+        total = self._total_tokens()
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions and total <= self.max_tokens:
+                break
+            session = self._sessions[session_id]
+            if session.busy:
+                continue
+            total -= session.context_tokens
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def get(self, session_id: str):
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def checkout(self, session_id: str, model: str):
+        """
+        Marks a session busy for one turn and returns (session, turn, status). status is "new"
+        (a session was created, under session_id if given), "resumed", or "busy" when the
+        session already has a turn in progress (session and turn are None then). turn is
+        passed back to checkin().
+        """
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None and session.busy:
+                return None, None, "busy"
+            status = "resumed"
+            if session is None or session.model != model:
+                session = ChatSession(session_id or uuid.uuid4().hex, model)
+                self._sessions[session.id] = session
+                status = "new"
+            session.busy = True
+            session.checkouts += 1
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session.id)
+            self._evict()
+            return session, session.checkouts, status
+
+    def checkin(self, session: ChatSession, turn: int, user: str = None, answer: str = None, context=None,
+                chunk_ids=()):
+        """
+        Ends a turn; later calls for the same turn do nothing. A completed turn (answer
+        given) is recorded together with Ollama's new context.
+        """
+        with self._lock:
+            if not session.busy or session.checkouts != turn:
+                return
+            if answer is not None:
+                session.turns.append({"user": user, "assistant": answer, "at": time.time()})
+                if context is not None and len(context) <= SESSION_MAX_CONTEXT_TOKENS:
+                    session.context = np.asarray(context, dtype=np.int32)
+                    session.sent_chunks.update(chunk_ids)
+                else:
+                    if session.context is not None or context is not None:
+                        self.context_resets += 1
+                    session.context = None
+                    session.sent_chunks = set()
+            session.busy = False
+            session.last_used = time.monotonic()
+            self._evict()
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "maxSessions": self.max_sessions,
+                "contextTokens": self._total_tokens(),
+                "maxTokens": self.max_tokens,
+                "idleTimeoutSeconds": self.idle_timeout,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "contextResets": self.context_resets
+            }
+
+chat_sessions = ChatSessionStore()
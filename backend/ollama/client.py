@@ -0,0 +1,73 @@
+# backend/ollama/client.py
+import os
+import atexit
+import asyncio
+import threading
+import weakref
+import httpx
+
+# Base URL of the local Ollama server and the pool/timeouts used for all traffic to it.
+OLLAMA_BASE_URL = os.getenv("MANDIAO_OLLAMA_URL", "http://localhost:11434").rstrip("/")
+POOL_MAX_CONNECTIONS = int(os.getenv("MANDIAO_OLLAMA_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.getenv("MANDIAO_OLLAMA_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("MANDIAO_OLLAMA_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("MANDIAO_OLLAMA_CONNECT_TIMEOUT", "5"))
+EMBED_TIMEOUT = float(os.getenv("MANDIAO_OLLAMA_EMBED_TIMEOUT", "30"))
+GENERATE_TIMEOUT = float(os.getenv("MANDIAO_OLLAMA_GENERATE_TIMEOUT", "60"))
+
+_client = None
+_client_lock = threading.Lock()
+# httpx.AsyncClient is bound to the event loop it was first used on, so keep one per loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+def ollama_url(path: str) -> str:
+    """Returns the absolute URL of an Ollama API path, e.g. ollama_url('/api/embed')."""
+    return f"{OLLAMA_BASE_URL}/{path.lstrip('/')}"
+
+def make_timeout(read: float) -> httpx.Timeout:
+    """Builds a timeout with the shared connect timeout and the given read/write timeout."""
+    return httpx.Timeout(read, connect=CONNECT_TIMEOUT)
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+    )
+
+def get_client() -> httpx.Client:
+    """
+    Returns the process-wide keep-alive httpx.Client used for Ollama requests.
+    httpx.Client is thread-safe, so all request threads share its connection pool.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        with _client_lock:
+            if _client is None or _client.is_closed:
+                _client = httpx.Client(limits=_limits(), timeout=make_timeout(GENERATE_TIMEOUT))
+    return _client
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the pooled httpx.AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=_limits(), timeout=make_timeout(GENERATE_TIMEOUT))
+        _async_clients[loop] = client
+    return client
+
+async def aclose_async_client():
+    """Closes the async client of the running event loop, if one was created."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def close_client():
+    """Closes the shared synchronous client; a new one is created on next use."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+atexit.register(close_client)
@@ -1,6 +1,40 @@
+import os
+
+# Model used for /api/generate and model used for /api/embed.
+CHAT_MODEL = os.getenv("MANDIAO_CHAT_MODEL", "deepseek-r1:1.5b")
+EMBEDDING_MODEL = os.getenv("MANDIAO_EMBEDDING_MODEL", "EntropyYue/jina-embeddings-v2-base-zh")
+# Other embedding models that have been used:
+# "jina/jina-embeddings-v2-base-en"
+
+# Output dimension of the embedding model. 0 means measure it with a probe request; the
+# table below is the fallback for known models while Ollama is not reachable yet.
+EMBEDDING_DIM = int(os.getenv("MANDIAO_EMBEDDING_DIM", "0"))
+KNOWN_EMBEDDING_DIMS = {
+    "EntropyYue/jina-embeddings-v2-base-zh": 768,
+    "jina/jina-embeddings-v2-base-en": 768,
+}
+
 MODELS = [
-    "deepseek-r1:1.5b",
+    CHAT_MODEL,
     # "deepseek-llm"
-    # "jina/jina-embeddings-v2-base-en"
-    "EntropyYue/jina-embeddings-v2-base-zh"
-]
\ No newline at end of file
+    EMBEDDING_MODEL
+]
+
+# How long Ollama keeps each model loaded after its last request: a duration such as "30m"
+# or "2h", a number of seconds, or -1 to keep it loaded until Ollama stops. Every generate
+# and embed request sends this value, since Ollama otherwise resets it to its 5m default.
+MODEL_KEEP_ALIVE = {
+    CHAT_MODEL: os.getenv("MANDIAO_CHAT_KEEP_ALIVE", "30m"),
+    EMBEDDING_MODEL: os.getenv("MANDIAO_EMBEDDING_KEEP_ALIVE", "30m"),
+}
+DEFAULT_KEEP_ALIVE = "5m"
+# Load every model in MODELS into memory when the server starts.
+PRELOAD_MODELS = os.getenv("MANDIAO_PRELOAD_MODELS", "1") not in ("0", "false", "no")
+
+def get_keep_alive(model: str):
+    """Returns the keep_alive value for a model's Ollama requests."""
+    value = str(MODEL_KEEP_ALIVE.get(model, DEFAULT_KEEP_ALIVE)).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
@@ -1,11 +1,54 @@
 import os
+import time
+import shutil
 import platform
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import tempfile
 from pathlib import Path
-import psutil
-from .models_config import MODELS
+from .models_config import MODELS, CHAT_MODEL, EMBEDDING_MODEL, PRELOAD_MODELS, get_keep_alive
+from .client import get_client, make_timeout, ollama_url, CONNECT_TIMEOUT, GENERATE_TIMEOUT
+from .pull import PullProgress, pull_model
+
+# Seconds a probe of the Ollama API (/api/tags, /api/ps) is reused before asking again.
+# Failed probes are cached too, so status polling does not hammer a stopped server.
+PROBE_TTL = float(os.getenv("MANDIAO_OLLAMA_PROBE_TTL", "2"))
+
+_probe_cache = {}  # path -> (fetched_at, response body or None if Ollama was unreachable)
+_probe_lock = threading.Lock()
+
+def probe_ollama(path: str):
+    """GETs an Ollama API path through the shared client, cached for PROBE_TTL seconds."""
+    now = time.monotonic()
+    with _probe_lock:
+        cached = _probe_cache.get(path)
+        if cached is not None and now - cached[0] < PROBE_TTL:
+            return cached[1]
+    try:
+        response = get_client().get(ollama_url(path), timeout=make_timeout(CONNECT_TIMEOUT))
+        response.raise_for_status()
+        body = response.json()
+    except Exception:
+        body = None
+    with _probe_lock:
+        _probe_cache[path] = (time.monotonic(), body)
+    return body
+
+def invalidate_probes():
+    """Forgets cached probes; called whenever setup installs, starts, pulls or loads something."""
+    with _probe_lock:
+        _probe_cache.clear()
+
+# Per-model result of the last preload: {"state": "loading" | "loaded" | "failed",
+# "seconds": load time, "error": message}. Shared by all OllamaManager instances.
+_preload_state = {}
+_preload_lock = threading.Lock()
+
+def _model_key(name: str) -> str:
+    """Ollama reports untagged models with an explicit ':latest' tag."""
+    return name if ":" in name.rsplit("/", 1)[-1] else f"{name}:latest"
 
 class OllamaManager:
     def __init__(self):
@@ -29,17 +72,9 @@ class OllamaManager:
                 return default_path
             
             # Check PATH environment variable
-            try:
-                result = subprocess.run(
-                    ['where', 'ollama'],
-                    capture_output=True,
-                    text=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
-                if result.returncode == 0:
-                    return Path(result.stdout.strip())
-            except Exception:
-                pass
+            found = shutil.which('ollama')
+            if found:
+                return Path(found)
             
             # Common alternative locations
             paths_to_check = [
@@ -65,80 +100,101 @@ class OllamaManager:
     
     def is_ollama_installed(self):
         """Check if Ollama is installed"""
-        try:
-            if self.system == 'windows':
-                # Check both default install path and PATH
-                path_exists = self.ollama_path.exists()
-                which_result = subprocess.run(
-                    ['where', 'ollama'],
-                    capture_output=True,
-                    text=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
-                return path_exists or which_result.returncode == 0
-            else:
-                result = subprocess.run(['which', 'ollama'], capture_output=True, text=True)
-                return result.returncode == 0
-        except Exception:
-            return False
+        if self.system == 'windows' and self.ollama_path.exists():
+            return True
+        return shutil.which('ollama') is not None
 
     def is_ollama_running(self):
-        """Check if Ollama process is running"""
-        try:
-            # Try querying ollama directly; add creation flags on Windows
-            if self.system == 'windows':
-                result = subprocess.run(
-                    [str(self.ollama_path), 'list'],
-                    capture_output=True,
-                    text=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
-            else:
-                result = subprocess.run(
-                    [str(self.ollama_path), 'list'],
-                    capture_output=True,
-                    text=True
-                )
-            return result.returncode == 0
-        except Exception:
-            # Fallback to process check
-            for proc in psutil.process_iter(['name', 'exe']):
-                try:
-                    proc_name = proc.info['name'].lower()
-                    proc_exe = proc.info['exe'].lower() if proc.info['exe'] else ''
-                    if 'ollama' in proc_name or 'ollama' in proc_exe:
-                        return True
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            return False
-    
-    def is_model_installed(self, model_name="deepseek-r1:1.5b"):
+        """Check if the Ollama server answers on its API"""
+        return probe_ollama("/api/tags") is not None
+
+    def get_installed_models(self):
+        """Names of the models Ollama has pulled (/api/tags), or None if Ollama cannot be reached."""
+        tags = probe_ollama("/api/tags")
+        if tags is None:
+            return None
+        return {entry.get("name") or entry.get("model") for entry in tags.get("models") or []}
+
+    def is_model_installed(self, model_name=CHAT_MODEL):
         """Check if model is installed"""
+        installed = self.get_installed_models()
+        return bool(installed) and (model_name in installed or _model_key(model_name) in installed)
+    
+    def preload_model(self, model_name=CHAT_MODEL):
+        """
+        Loads a model into Ollama's memory with an empty request and pins it for its
+        configured keep_alive, so the first real request does not pay the load time.
+        """
+        with _preload_lock:
+            _preload_state[model_name] = {"state": "loading", "seconds": None, "error": None}
+        started = time.perf_counter()
         try:
-            if self.system == 'windows':
-                result = subprocess.run(
-                    [str(self.ollama_path), 'list'],
-                    capture_output=True,
-                    text=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
+            if model_name == EMBEDDING_MODEL:
+                # Embedding models cannot generate; a one-word embedding loads them instead.
+                path, payload = "/api/embed", {"model": model_name, "input": "warmup"}
             else:
-                result = subprocess.run(
-                    [str(self.ollama_path), 'list'],
-                    capture_output=True,
-                    text=True
-                )
-            return model_name in result.stdout
-        except Exception:
-            return False
-    
+                # /api/generate without a prompt only loads the model.
+                path, payload = "/api/generate", {"model": model_name}
+            payload["keep_alive"] = get_keep_alive(model_name)
+            response = get_client().post(ollama_url(path), json=payload, timeout=make_timeout(GENERATE_TIMEOUT))
+            response.raise_for_status()
+            state = {"state": "loaded", "seconds": round(time.perf_counter() - started, 3), "error": None}
+            print(f"DEBUG: Model {model_name} preloaded in {state['seconds']}s.")
+        except Exception as e:
+            state = {"state": "failed", "seconds": None, "error": str(e)}
+            print(f"DEBUG: Failed to preload model {model_name}: {e}")
+        with _preload_lock:
+            _preload_state[model_name] = state
+        invalidate_probes()
+        return state["state"] == "loaded"
+
+    def preload_models(self, models=MODELS):
+        """Preloads every model, one after another, and returns whether all of them loaded."""
+        return all([self.preload_model(model) for model in models])
+
+    def get_loaded_models(self):
+        """
+        Returns {model: {"size", "sizeVram", "expiresAt"}} for the models Ollama currently
+        holds in memory (/api/ps), or None if Ollama cannot be reached.
+        """
+        ps = probe_ollama("/api/ps")
+        if ps is None:
+            return None
+        return {
+            entry.get("name") or entry.get("model"): {
+                "size": entry.get("size"),
+                "sizeVram": entry.get("size_vram"),
+                "expiresAt": entry.get("expires_at")
+            }
+            for entry in ps.get("models") or []
+        }
+
+    def get_model_load_state(self, models=MODELS):
+        """Load state of each model for /api/status: residency from /api/ps plus the last preload."""
+        loaded = self.get_loaded_models()
+        with _preload_lock:
+            preload = dict(_preload_state)
+        state = {}
+        for model in models:
+            resident = None if loaded is None else loaded.get(_model_key(model), loaded.get(model))
+            state[model] = {
+                "loaded": None if loaded is None else resident is not None,
+                "expiresAt": resident["expiresAt"] if resident else None,
+                "sizeVram": resident["sizeVram"] if resident else None,
+                "keepAlive": get_keep_alive(model),
+                "preload": preload.get(model)
+            }
+        return state
+
     def setup_ollama(self, progress_callback=None):
         print("DEBUG: Starting setup_ollama")
+        invalidate_probes()
         if not self.is_ollama_installed():
             print("DEBUG: Ollama is not installed. Beginning installation.")
             if progress_callback:
                 progress_callback('downloading', 0)
             self._install_ollama(progress_callback)
+            invalidate_probes()
         else:
             print("DEBUG: Ollama is already installed.")
 
@@ -147,21 +203,25 @@ class OllamaManager:
             if progress_callback:
                 progress_callback('starting', 80)
             self._start_ollama()
+            invalidate_probes()
         else:
             print("DEBUG: Ollama is already running.")
 
-        # Instead of checking for a single model, loop through all models in MODELS.
+        missing = [model for model in MODELS if not self.is_model_installed(model)]
         for model in MODELS:
-            if not self.is_model_installed(model):
-                print(f"DEBUG: Model {model} is not installed. Pulling model.")
-                if progress_callback:
-                    progress_callback('pulling_model', 90)
-                try:
-                    self._pull_model(progress_callback, model)
-                except Exception as e:
-                    raise Exception(f"Failed to pull model {model}: {str(e)}")
-            else:
+            if model not in missing:
                 print(f"DEBUG: Model {model} is already installed.")
+        if missing:
+            print(f"DEBUG: Models {missing} are not installed. Pulling models.")
+            try:
+                self._pull_models(missing, progress_callback)
+            finally:
+                invalidate_probes()
+
+        if PRELOAD_MODELS:
+            if progress_callback:
+                progress_callback('loading_models', 99)
+            self.preload_models()
 
         if progress_callback:
             progress_callback('complete', 100)
@@ -320,50 +380,39 @@ class OllamaManager:
         except subprocess.CalledProcessError as e:
             print("DEBUG: Failed to start Ollama:", e.stderr.decode())
     
-    def _pull_model(self, progress_callback=None, model_name="deepseek-r1:1.5b"):
-        """Pull model with progress debugging and hidden window on Windows."""
-        try:
-            print(f"DEBUG: Starting to pull model '{model_name}'.")
-            env = os.environ.copy()
-            env['PYTHONIOENCODING'] = 'utf-8'
-            env['LANG'] = 'en_US.UTF-8'
-            
-            if self.system == 'windows':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                startupinfo.wShowWindow = subprocess.SW_HIDE
-                creationflags = subprocess.CREATE_NO_WINDOW
-            else:
-                startupinfo = None
-                creationflags = 0
-            
-            process = subprocess.Popen(
-                [str(self.ollama_path), 'pull', model_name],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                encoding='utf-8',
-                errors='replace',  # Replace problematic characters instead of crashing
-                bufsize=1,
-                env=env,
-                startupinfo=startupinfo,
-                creationflags=creationflags
-            )
-            
-            for line in process.stdout:
-                line = line.strip()
-                print(f"DEBUG: Pull model output: {line}")
-                if 'pulling manifest' in line and progress_callback:
-                    progress_callback('pulling_model', 90)
-                elif 'downloading' in line and progress_callback:
-                    progress_callback('pulling_model', 92)
-                elif 'extracting' in line and progress_callback:
-                    progress_callback('pulling_model', 95)
-                elif 'complete' in line and progress_callback:
-                    progress_callback('pulling_model', 99)
-            process.wait()
-            if process.returncode != 0:
-                raise subprocess.CalledProcessError(process.returncode, process.args)
-            print("DEBUG: Model pulling completed successfully.")
-        except Exception as e:
-            raise Exception(f"Failed to pull model: {str(e)}")
\ No newline at end of file
+    def _pull_models(self, models, progress_callback=None):
+        """
+        Pulls models concurrently through Ollama's /api/pull. The pulling_model stage moves
+        from 90 to 99 with the bytes downloaded, and its third callback argument carries the
+        byte counts and throughput from PullProgress.snapshot().
+        """
+        def report(progress):
+            if progress_callback:
+                progress_callback('pulling_model', 90 + int(9 * progress.fraction()), progress.snapshot())
+
+        progress = PullProgress(models, on_change=report)
+        report(progress)
+        with ThreadPoolExecutor(max_workers=len(models), thread_name_prefix="model-pull") as executor:
+            futures = {model: executor.submit(self._pull_model, model, progress) for model in models}
+        errors = []
+        for model, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(f"{model}: {e}")
+        if errors:
+            raise Exception(f"Failed to pull models: {'; '.join(errors)}")
+
+    def _pull_model(self, model_name=CHAT_MODEL, progress=None):
+        """Pull one model via /api/pull, retrying interrupted downloads with backoff."""
+        print(f"DEBUG: Starting to pull model '{model_name}'.")
+        pull_model(model_name, progress or PullProgress([model_name]))
+        print(f"DEBUG: Model '{model_name}' pulling completed successfully.")
+
+def start_model_preload():
+    """Preloads MODELS on a background thread at server start (disable with MANDIAO_PRELOAD_MODELS=0)."""
+    if not PRELOAD_MODELS:
+        return None
+    thread = threading.Thread(target=lambda: OllamaManager().preload_models(), name="model-preload", daemon=True)
+    thread.start()
+    return thread
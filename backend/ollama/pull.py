@@ -0,0 +1,153 @@
+# backend/ollama/pull.py
+import os
+import json
+import time
+import threading
+import httpx
+from .client import get_client, make_timeout, ollama_url
+
+# Longest silence allowed between two progress lines of /api/pull, attempts per model, and
+# the exponential backoff between attempts (doubling from PULL_BACKOFF up to PULL_BACKOFF_MAX).
+PULL_TIMEOUT = float(os.getenv("MANDIAO_OLLAMA_PULL_TIMEOUT", "120"))
+PULL_ATTEMPTS = int(os.getenv("MANDIAO_PULL_ATTEMPTS", "5"))
+PULL_BACKOFF = float(os.getenv("MANDIAO_PULL_BACKOFF", "1"))
+PULL_BACKOFF_MAX = float(os.getenv("MANDIAO_PULL_BACKOFF_MAX", "30"))
+# Substrings of stream errors that mean the model itself cannot be pulled.
+PERMANENT_PULL_ERRORS = ("manifest", "not found", "does not exist")
+# Smoothing of the reported throughput and how often it is recomputed.
+THROUGHPUT_ALPHA = 0.3
+THROUGHPUT_INTERVAL = 0.5
+
+class PullError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+class PullProgress:
+    """
+    Byte progress of concurrent model pulls. Ollama streams progress per layer (digest);
+    completed bytes are kept per layer as the maximum seen, so a retried pull, which Ollama
+    resumes from its partial download, never makes the reported progress go backwards.
+    """
+
+    def __init__(self, models, on_change=None):
+        self.on_change = on_change
+        self._models = {model: {
+            "status": "waiting",
+            "layers": {},  # digest -> [completed, total]
+            "attempt": 0,
+            "bytesPerSecond": 0.0,
+            "error": None,
+            "_sample": None  # (time, completed) of the last throughput sample
+        } for model in models}
+        self._lock = threading.Lock()
+
+    def update(self, model: str, status: str = None, digest: str = None, completed: int = None,
+               total: int = None, attempt: int = None, error: str = None):
+        with self._lock:
+            entry = self._models[model]
+            if status is not None:
+                entry["status"] = status
+            if attempt is not None:
+                entry["attempt"] = attempt
+            if error is not None:
+                entry["error"] = error
+            if digest and total:
+                layer = entry["layers"].setdefault(digest, [0, total])
+                layer[1] = total
+                layer[0] = max(layer[0], min(completed or 0, total))
+            now = time.monotonic()
+            done = sum(layer[0] for layer in entry["layers"].values())
+            sample = entry["_sample"]
+            if sample is None:
+                entry["_sample"] = (now, done)
+            elif now - sample[0] >= THROUGHPUT_INTERVAL:
+                rate = max(0.0, (done - sample[1]) / (now - sample[0]))
+                entry["bytesPerSecond"] = THROUGHPUT_ALPHA * rate + (1 - THROUGHPUT_ALPHA) * entry["bytesPerSecond"]
+                entry["_sample"] = (now, done)
+            if status in ("success", "failed"):
+                entry["bytesPerSecond"] = 0.0
+        if self.on_change:
+            self.on_change(self)
+
+    def snapshot(self) -> dict:
+        """Per-model and overall bytes completed, total bytes known so far, and throughput."""
+        with self._lock:
+            models = {}
+            for model, entry in self._models.items():
+                models[model] = {
+                    "status": entry["status"],
+                    "completed": sum(layer[0] for layer in entry["layers"].values()),
+                    "total": sum(layer[1] for layer in entry["layers"].values()),
+                    "bytesPerSecond": round(entry["bytesPerSecond"], 1),
+                    "attempt": entry["attempt"],
+                    "error": entry["error"]
+                }
+        return {
+            "models": models,
+            "completed": sum(entry["completed"] for entry in models.values()),
+            "total": sum(entry["total"] for entry in models.values()),
+            "bytesPerSecond": round(sum(entry["bytesPerSecond"] for entry in models.values()), 1)
+        }
+
+    def fraction(self) -> float:
+        snapshot = self.snapshot()
+        return snapshot["completed"] / snapshot["total"] if snapshot["total"] else 0.0
+
+def _is_retryable(error: str) -> bool:
+    """
+    Ollama reports an unknown or misspelled model as an error line in a 200 stream (e.g.
+    "pull model manifest: file does not exist"); retrying those cannot succeed.
+    """
+    error = error.lower()
+    return not any(marker in error for marker in PERMANENT_PULL_ERRORS)
+
+def _stream_pull(model: str, progress: PullProgress):
+    """Runs one /api/pull request to completion; raises PullError if it does not succeed."""
+    payload = {"model": model, "stream": True}
+    try:
+        with get_client().stream("POST", ollama_url("/api/pull"), json=payload,
+                                 timeout=make_timeout(PULL_TIMEOUT)) as response:
+            if response.status_code != 200:
+                detail = response.read().decode("utf-8", errors="replace")
+                raise PullError(f"Received status {response.status_code}: {detail}",
+                                retryable=response.status_code >= 500)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "error" in message:
+                    raise PullError(message["error"], retryable=_is_retryable(message["error"]))
+                status = message.get("status", "")
+                progress.update(model, status=status, digest=message.get("digest"),
+                                completed=message.get("completed"), total=message.get("total"))
+                if status == "success":
+                    return
+    except httpx.TransportError as e:
+        raise PullError(f"Connection to Ollama failed: {e}")
+    raise PullError("Pull stream ended before Ollama reported success")
+
+def pull_model(model: str, progress: PullProgress, attempts: int = PULL_ATTEMPTS):
+    """
+    Pulls a model through Ollama's streaming /api/pull endpoint. Interrupted pulls are
+    retried with exponential backoff; Ollama keeps the partially downloaded layers, so each
+    retry resumes where the previous attempt stopped.
+    """
+    delay = PULL_BACKOFF
+    for attempt in range(1, max(1, attempts) + 1):
+        progress.update(model, status="pulling manifest", attempt=attempt)
+        try:
+            _stream_pull(model, progress)
+            print(f"DEBUG: Model {model} pulled on attempt {attempt}.")
+            return
+        except PullError as e:
+            if not e.retryable or attempt >= attempts:
+                progress.update(model, status="failed", error=str(e))
+                raise
+            print(f"DEBUG: Pull of {model} interrupted ({e}); retrying in {delay:.1f}s.")
+            progress.update(model, status="retrying", error=str(e))
+            time.sleep(delay)
+            delay = min(delay * 2, PULL_BACKOFF_MAX)
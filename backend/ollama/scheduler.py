@@ -0,0 +1,160 @@
+# backend/ollama/scheduler.py
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+
+# Chat generations streamed from Ollama at the same time, requests allowed to wait for a
+# slot (in total and per client), and how long a request may wait before giving up.
+MAX_GENERATIONS = int(os.getenv("MANDIAO_MAX_GENERATIONS", "1"))
+GENERATION_QUEUE_SIZE = int(os.getenv("MANDIAO_GENERATION_QUEUE_SIZE", "16"))
+GENERATION_QUEUE_PER_CLIENT = int(os.getenv("MANDIAO_GENERATION_QUEUE_PER_CLIENT", "4"))
+GENERATION_QUEUE_TIMEOUT = float(os.getenv("MANDIAO_GENERATION_QUEUE_TIMEOUT", "300"))
+# Generation time assumed for Retry-After before any generation has finished.
+DEFAULT_GENERATION_SECONDS = 10.0
+
+class GenerationTicket:
+    def __init__(self, client: str):
+        self.client = client
+        self.created_at = time.monotonic()
+        self.admitted_at = None
+        self.released = False
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+class GenerationScheduler:
+    """
+    Admission control for Ollama generations. At most max_in_flight generations run at once;
+    further requests wait in a bounded queue and are admitted round-robin across clients, so
+    one client sending many questions cannot starve the others. When the queue (or the
+    client's share of it) is full, try_submit() returns None and the caller answers 429.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_GENERATIONS, max_queue: int = GENERATION_QUEUE_SIZE,
+                 max_per_client: int = GENERATION_QUEUE_PER_CLIENT):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.avg_generation_seconds = None
+        self._waiting = OrderedDict()  # client -> deque of tickets; order is the round-robin turn
+        self._condition = threading.Condition()
+
+    def _waiting_count(self) -> int:
+        return sum(len(tickets) for tickets in self._waiting.values())
+
+    def _dispatch(self):
+        """Admits waiting tickets round-robin while slots are free; call with the lock held."""
+        while self.in_flight < self.max_in_flight and self._waiting:
+            client, tickets = next(iter(self._waiting.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                self._waiting.move_to_end(client)
+            else:
+                del self._waiting[client]
+            ticket.admitted_at = time.monotonic()
+            self.in_flight += 1
+            self.admitted += 1
+        self._condition.notify_all()
+
+    def try_submit(self, client: str):
+        """Queues a generation for a client; returns its ticket, or None if the queue is full."""
+        with self._condition:
+            if self._waiting_count() >= self.max_queue or \
+                    len(self._waiting.get(client, ())) >= self.max_per_client:
+                self.rejected += 1
+                return None
+            ticket = GenerationTicket(client)
+            self._waiting.setdefault(client, deque()).append(ticket)
+            self._dispatch()
+            return ticket
+
+    def position(self, ticket: GenerationTicket) -> int:
+        """1-based place of a waiting ticket in the round-robin admission order; 0 once admitted."""
+        with self._condition:
+            if ticket.admitted or ticket.released:
+                return 0
+            tickets = self._waiting.get(ticket.client, ())
+            if ticket not in tickets:
+                return 0
+            rank = tickets.index(ticket)
+            ahead, before_client = 0, True
+            for client, queued in self._waiting.items():
+                if client == ticket.client:
+                    before_client = False
+                # Every client is served once per round: `rank` full rounds go first, plus the
+                # turns of clients ahead of this one in the current round.
+                ahead += min(len(queued), rank) + (1 if before_client and len(queued) > rank else 0)
+            return ahead + 1
+
+    def client_positions(self, client: str) -> list:
+        """Queue positions of a client's waiting tickets."""
+        with self._condition:
+            tickets = list(self._waiting.get(client, ()))
+        return [self.position(ticket) for ticket in tickets]
+
+    def wait(self, ticket: GenerationTicket, timeout: float = GENERATION_QUEUE_TIMEOUT) -> bool:
+        """Blocks until the ticket is admitted. On timeout the ticket is withdrawn and False is returned."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not ticket.admitted and not ticket.released:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if ticket.admitted:
+                return True
+            if not ticket.released:
+                self.timed_out += 1
+        self.release(ticket)
+        return False
+
+    def release(self, ticket: GenerationTicket):
+        """Frees the ticket's slot or queue place. Safe to call more than once."""
+        with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.admitted:
+                self.in_flight -= 1
+                seconds = time.monotonic() - ticket.admitted_at
+                self.avg_generation_seconds = seconds if self.avg_generation_seconds is None \
+                    else 0.8 * self.avg_generation_seconds + 0.2 * seconds
+            else:
+                tickets = self._waiting.get(ticket.client)
+                if tickets is not None and ticket in tickets:
+                    tickets.remove(ticket)
+                    if not tickets:
+                        del self._waiting[ticket.client]
+            self._dispatch()
+
+    def retry_after(self) -> int:
+        """Seconds until a queue place is likely to free up, for the Retry-After header."""
+        with self._condition:
+            seconds = self.avg_generation_seconds or DEFAULT_GENERATION_SECONDS
+            backlog = self._waiting_count() + 1
+            return max(1, math.ceil(seconds * backlog / self.max_in_flight))
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "maxInFlight": self.max_in_flight,
+                "inFlight": self.in_flight,
+                "waiting": self._waiting_count(),
+                "maxQueue": self.max_queue,
+                "maxPerClient": self.max_per_client,
+                "waitingClients": len(self._waiting),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timedOut": self.timed_out,
+                "avgGenerationSeconds": round(self.avg_generation_seconds, 3)
+                if self.avg_generation_seconds is not None else None
+            }
+
+generation_scheduler = GenerationScheduler()
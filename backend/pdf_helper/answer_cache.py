@@ -0,0 +1,157 @@
+# backend/pdf_helper/answer_cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from .store import db_connection, add_change_listener
+from .registry import get_file_hash
+from .vector_index import normalize_rows
+
+# Completed chat answers kept for replay (0 disables the cache), how long they stay valid, and
+# the cosine similarity a new question's embedding needs to reuse a stored answer.
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("MANDIAO_ANSWER_CACHE_MAX_ENTRIES", "256"))
+ANSWER_CACHE_TTL = float(os.getenv("MANDIAO_ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("MANDIAO_ANSWER_CACHE_THRESHOLD", "0.95"))
+# Characters per piece when a cached answer is streamed back.
+REPLAY_CHUNK_CHARS = 64
+
+class SemanticAnswerCache:
+    """
+    In-process LRU cache of generated chat answers, looked up by query embedding similarity.
+    A stored answer is only reused when the new question retrieved exactly the same chunks
+    with the same chat model, and the registry hashes of the documents those chunks came
+    from have not changed since the answer was generated.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._next_key = 0
+        self._entries = OrderedDict()  # key -> entry dict
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _chunk_key(chunks) -> frozenset:
+        return frozenset(row[0] for row in chunks)
+
+    @staticmethod
+    def _document_hashes(chunks, db_paths) -> dict:
+        sources = {row[2] for row in chunks}
+        hashes = {}
+        for db_path in db_paths:
+            with db_connection(db_path) as db:
+                hashes.update({(str(db_path), source): get_file_hash(db, source) for source in sources})
+        return hashes
+
+    @staticmethod
+    def _shard_key(db_paths) -> tuple:
+        return tuple(sorted(str(db_path) for db_path in db_paths))
+
+    def get(self, model: str, query_embedding: np.ndarray, chunks, db_paths=(None,)):
+        """
+        Returns the stored answer for a similar question with the same context, or None.
+        db_paths are the collection shards the chunks were retrieved from.
+        """
+        if not self.enabled:
+            return None
+        query = normalize_rows(query_embedding)[0]
+        chunk_key = self._chunk_key(chunks)
+        shard_key = self._shard_key(db_paths)
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if now - entry["stored_at"] > self.ttl]:
+                del self._entries[key]
+                self.expirations += 1
+            candidates = [(key, entry) for key, entry in self._entries.items()
+                          if entry["model"] == model and entry["chunks"] == chunk_key
+                          and entry["shards"] == shard_key]
+            best = None
+            if candidates:
+                similarities = np.vstack([entry["embedding"] for _, entry in candidates]) @ query
+                i = int(np.argmax(similarities))
+                if similarities[i] >= self.threshold:
+                    best = candidates[i]
+            if best is None:
+                self.misses += 1
+                return None
+        key, entry = best
+        if self._document_hashes(chunks, db_paths) != entry["documents"]:
+            with self._lock:
+                self._entries.pop(key, None)
+                self.invalidations += 1
+                self.misses += 1
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return entry["answer"]
+
+    def put(self, model: str, query_embedding: np.ndarray, chunks, answer: str, db_paths=(None,)):
+        if not self.enabled or not answer:
+            return
+        entry = {
+            "stored_at": time.monotonic(),
+            "model": model,
+            "embedding": normalize_rows(query_embedding)[0],
+            "chunks": self._chunk_key(chunks),
+            "shards": self._shard_key(db_paths),
+            "documents": self._document_hashes(chunks, db_paths),
+            "answer": answer
+        }
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "ttlSeconds": self.ttl,
+                "threshold": self.threshold,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+    # Change listener: clearing the database invalidates every answer at once. Changed
+    # documents are caught at lookup time through their registry hashes.
+    def on_insert(self, db_path, rowids, embeddings):
+        pass
+
+    def on_delete(self, db_path, rowids):
+        pass
+
+    def on_clear(self, db_path):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+def replay_answer(answer: str):
+    """Yields a cached answer in pieces, like a streamed generation."""
+    for i in range(0, len(answer), REPLAY_CHUNK_CHARS):
+        yield answer[i:i + REPLAY_CHUNK_CHARS]
+
+answer_cache = SemanticAnswerCache()
+add_change_listener(answer_cache)
@@ -0,0 +1,146 @@
+# backend/pdf_helper/context.py
+import os
+import re
+import threading
+
+# Estimated prompt tokens the retrieved context may use.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("MANDIAO_CONTEXT_TOKEN_BUDGET", "1500"))
+# Adjacent chunks from split_documents share up to chunk_overlap (80) characters; a little
+# slack covers whitespace the splitter trims. Shorter matches are treated as coincidence.
+MAX_OVERLAP_CHARS = 120
+MIN_OVERLAP_CHARS = 8
+# Sections are only cut to fit the budget if at least this many tokens of them still fit.
+MIN_SECTION_TOKENS = 32
+SECTION_GAP = "\n...\n"
+
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local token estimate: about one token per CJK character and one per four other
+    characters, which is close to the chat model's tokenizer for mixed Chinese/English text.
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _chunk_index(chunk_id: str) -> int:
+    # Chunk ids are "source:page:index"; the source itself may contain colons.
+    try:
+        return int(chunk_id.rsplit(":", 1)[1])
+    except (IndexError, ValueError):
+        return -1
+
+def _overlap(previous: str, text: str) -> int:
+    """Length of the longest suffix of previous that starts text."""
+    for size in range(min(len(previous), len(text), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:size]):
+            return size
+    return 0
+
+def merge_chunks(chunks) -> list:
+    """
+    Groups retrieved (id, text, source, page, distance) rows by page, in order of each page's
+    best-ranked chunk. Within a page, duplicates are dropped and chunks are put back in
+    document order: consecutive chunks are joined with their shared overlap removed, and
+    gaps between non-consecutive chunks are marked. Returns [(source, page, text)].
+    """
+    pages = {}
+    for doc_id, text, source, page, distance in chunks:
+        pages.setdefault((source, page), {})[doc_id] = text
+    sections = []
+    for (source, page), texts in pages.items():
+        ordered = sorted(texts.items(), key=lambda item: _chunk_index(item[0]))
+        merged, last_index = "", None
+        for doc_id, text in ordered:
+            index = _chunk_index(doc_id)
+            if last_index is None:
+                merged = text
+            elif index == last_index + 1:
+                merged += text[_overlap(merged, text):]
+            else:
+                merged += SECTION_GAP + text
+            last_index = index
+        sections.append((source, page, merged))
+    return sections
+
+def _format_section(source, page, text: str) -> str:
+    return f"Source: {source}, Page: {page}:\n{text}"
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cuts text at the last whitespace before it exceeds the token estimate."""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > len(cut) // 2 else cut) + " ..."
+
+def assemble_context(chunks, token_budget: int = None):
+    """
+    Builds the retrieved-context block of the prompt from merged page sections, fitted into
+    token_budget (CONTEXT_TOKEN_BUDGET by default) by estimated tokens. Returns
+    (context, stats), where stats compares the estimate with the verbatim concatenation.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    verbatim = "\n\n".join(_format_section(source, page, text) for _, text, source, page, _ in chunks)
+    parts, used, truncated = [], 0, False
+    for source, page, text in merge_chunks(chunks):
+        section = _format_section(source, page, text)
+        tokens = estimate_tokens(section)
+        if used + tokens > token_budget:
+            truncated = True
+            remaining = token_budget - used - estimate_tokens(_format_section(source, page, ""))
+            if remaining >= MIN_SECTION_TOKENS:
+                section = _format_section(source, page, _truncate_to_tokens(text, remaining))
+                parts.append(section)
+                used += estimate_tokens(section)
+            break
+        parts.append(section)
+        used += tokens
+    context = "\n\n".join(parts) if parts else "No relevant context found."
+    raw_tokens = estimate_tokens(verbatim)
+    context_tokens = estimate_tokens(context) if parts else 0
+    stats = {
+        "chunks": len(chunks),
+        "sections": len(parts),
+        "raw_tokens": raw_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": max(0, raw_tokens - context_tokens),
+        "truncated": truncated,
+        "token_budget": token_budget
+    }
+    context_totals.record(stats)
+    return context, stats
+
+class ContextTotals:
+    """Running totals of the context builder, reported by /api/status."""
+
+    def __init__(self):
+        self.prompts = 0
+        self.raw_tokens = 0
+        self.context_tokens = 0
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def record(self, stats: dict):
+        with self._lock:
+            self.prompts += 1
+            self.raw_tokens += stats["raw_tokens"]
+            self.context_tokens += stats["context_tokens"]
+            self.truncated += int(stats["truncated"])
+
+    def stats(self) -> dict:
+        return {
+            "prompts": self.prompts,
+            "rawTokens": self.raw_tokens,
+            "contextTokens": self.context_tokens,
+            "tokensSaved": max(0, self.raw_tokens - self.context_tokens),
+            "truncated": self.truncated,
+            "tokenBudget": CONTEXT_TOKEN_BUDGET
+        }
+
+context_totals = ContextTotals()
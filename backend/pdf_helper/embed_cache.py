@@ -0,0 +1,178 @@
+# backend/pdf_helper/embed_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+import numpy as np
+
+# Upper bound for the stored embedding bytes; least recently used rows are evicted past it.
+EMBED_CACHE_MAX_BYTES = int(os.getenv("MANDIAO_EMBED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Resolution of the LRU clock: a hit only rewrites last_used when the stored value is older
+# than this, so repeated hits on warm rows are pure reads with no write transaction.
+LAST_USED_RESOLUTION = float(os.getenv("MANDIAO_EMBED_CACHE_LAST_USED_RESOLUTION", "300"))
+
+def text_hash(text: str) -> str:
+    """Content address of a chunk text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (embedding model name, sha256 of the text).
+    Embeddings are stored as float32 blobs in a sidecar SQLite file and evicted in
+    least-recently-used order once the stored bytes exceed max_bytes.
+    """
+
+    def __init__(self, path: Path = None, max_bytes: int = EMBED_CACHE_MAX_BYTES):
+        if path is None:
+            app_data_dir = Path.home() / ".mandiao"
+            app_data_dir.mkdir(exist_ok=True)
+            path = app_data_dir / "embed_cache.db"
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._db.commit()
+        self._total_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def get_many(self, model: str, texts: list[str]) -> list:
+        """Returns one float32 vector per text, or None where the text is not cached."""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        stale = []
+        now = time.time()
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT text_hash, embedding, last_used FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for h, embedding, last_used in rows:
+                    found[h] = embedding
+                    if now - last_used > LAST_USED_RESOLUTION:
+                        stale.append(h)
+            if stale:
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in stale]
+                )
+                self._db.commit()
+            results = [np.frombuffer(found[h], dtype=np.float32) if h in found else None for h in hashes]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: list[str], embeddings: np.ndarray):
+        """Stores the embeddings of the given texts and evicts old rows if over budget."""
+        now = time.time()
+        rows = [
+            (model, text_hash(text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings(model, text_hash, embedding, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._db.commit()
+            self._total_bytes += sum(len(row[2]) for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Recount first: INSERT OR REPLACE of an existing key over-counts the running total.
+        self._total_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings"
+        ).fetchone()[0]
+        while self._total_bytes > self.max_bytes:
+            victims = self._db.execute(
+                "SELECT model, text_hash, LENGTH(embedding) FROM embeddings ORDER BY last_used ASC LIMIT 256"
+            ).fetchall()
+            if not victims:
+                break
+            freed = 0
+            evicted = []
+            for model, h, size in victims:
+                evicted.append((model, h))
+                freed += size
+                if self._total_bytes - freed <= self.max_bytes:
+                    break
+            self._db.executemany("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", evicted)
+            self._total_bytes -= freed
+            self.evictions += len(evicted)
+        self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM embeddings")
+            self._db.commit()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes,
+            "maxBytes": self.max_bytes
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Returns the process-wide embedding cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+def cached_encode(model, texts, **encode_kwargs) -> np.ndarray:
+    """
+    Encodes texts with the given embedding wrapper, consulting the embedding cache first.
+    Only the cache misses are sent to model.encode(); rows are returned in input order.
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+    texts = list(texts)
+    cache = get_embedding_cache()
+    cached = cache.get_many(model.model, texts)
+    # Group the misses by text so duplicate chunks are only embedded once.
+    missing = {}
+    for i, embedding in enumerate(cached):
+        if embedding is None:
+            missing.setdefault(texts[i], []).append(i)
+    if missing:
+        missing_texts = list(missing)
+        computed = model.encode(missing_texts, **encode_kwargs).astype(np.float32)
+        cache.put_many(model.model, missing_texts, computed)
+        for text, embedding in zip(missing_texts, computed):
+            for i in missing[text]:
+                cached[i] = embedding
+    return np.vstack(cached).astype(np.float32)
@@ -1,45 +1,139 @@
-import httpx
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from ..ollama.client import get_client, get_async_client, make_timeout, ollama_url, EMBED_TIMEOUT
+from ..ollama.models_config import EMBEDDING_MODEL, EMBEDDING_DIM, KNOWN_EMBEDDING_DIMS, get_keep_alive
+
+# Number of texts sent per /api/embed request and how many of those requests may be
+# in flight at once. Both can be tuned per machine through environment variables.
+EMBED_BATCH_SIZE = int(os.getenv("MANDIAO_EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("MANDIAO_EMBED_MAX_IN_FLIGHT", "4"))
+
+def _split_batches(texts, batch_size: int) -> list[list[str]]:
+    # Normalize to a list if a single string is provided.
+    if isinstance(texts, str):
+        texts = [texts]
+    texts = list(texts)
+    batch_size = max(1, batch_size)
+    return [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)] or [[]]
+
+def _parse_embeddings(data: dict, expected: int) -> np.ndarray:
+    """Extracts the embedding rows from an /api/embed response body."""
+    # First try "embedding", then fall back to "embeddings".
+    embedding = data.get("embedding")
+    if embedding is None:
+        embedding = data.get("embeddings")
+        if embedding is None:
+            raise Exception(f"Missing 'embedding' key in response: {data}")
+    # Return a numpy array (assuming a list or list of lists structure)
+    embedding = np.array(embedding)
+    if embedding.ndim == 1:
+        embedding = embedding.reshape(1, -1)
+    if len(embedding) != expected:
+        raise Exception(f"Expected {expected} embeddings, got {len(embedding)}")
+    return embedding
 
 class OllamaEmbeddingWrapper:
-    def __init__(self, api_url: str = "http://localhost:11434/api/embed", 
-                 model: str = "EntropyYue/jina-embeddings-v2-base-zh"):
+    def __init__(self, api_url: str = ollama_url("/api/embed"), 
+                 model: str = EMBEDDING_MODEL):
         self.api_url = api_url
         self.model = model
 
-    def encode(self, texts, batch_size: int = 1) -> np.ndarray:
+    def encode(self, texts, batch_size: int = EMBED_BATCH_SIZE,
+               max_in_flight: int = EMBED_MAX_IN_FLIGHT) -> np.ndarray:
         """
         Mimics SentenceTransformer.encode().
         Accepts a single string or a list of strings and returns a numpy array
         with the embedding(s) obtained from the Ollama /api/embed endpoint.
+        Lists longer than batch_size are split into batches, up to max_in_flight of
+        which are requested concurrently; rows are returned in input order.
         """
-        # Normalize to a list if a single string is provided.
-        if isinstance(texts, str):
-            texts = [texts]
-        
+        batches = _split_batches(texts, batch_size)
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+        workers = max(1, min(max_in_flight, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # executor.map preserves the order of the batches.
+            results = list(executor.map(self._embed_batch, batches))
+        return np.vstack(results)
+
+    def _embed_batch(self, texts: list[str]) -> np.ndarray:
+        """Sends a single /api/embed request for the given texts over the shared client."""
+        payload = {
+            "model": self.model,
+            "input": texts,  # The API accepts a string or a list under "input"
+            "keep_alive": get_keep_alive(self.model)
+        }
+        try:
+            response = get_client().post(self.api_url, json=payload, timeout=make_timeout(EMBED_TIMEOUT))
+            response.raise_for_status()
+            return _parse_embeddings(response.json(), len(texts))
+        except Exception as e:
+            raise Exception(f"Failed to fetch embedding from Ollama: {e}")
+
+class AsyncOllamaEmbeddingWrapper(OllamaEmbeddingWrapper):
+    """
+    Async counterpart of OllamaEmbeddingWrapper with the same encode() contract.
+    Batches are awaited concurrently on the pooled AsyncClient of the running event loop.
+    """
+
+    async def encode(self, texts, batch_size: int = EMBED_BATCH_SIZE,
+                     max_in_flight: int = EMBED_MAX_IN_FLIGHT) -> np.ndarray:
+        batches = _split_batches(texts, batch_size)
+        if len(batches) == 1:
+            return await self._embed_batch(batches[0])
+        semaphore = asyncio.Semaphore(max(1, max_in_flight))
+
+        async def run(batch):
+            async with semaphore:
+                return await self._embed_batch(batch)
+
+        # asyncio.gather preserves the order of the batches.
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return np.vstack(results)
+
+    async def _embed_batch(self, texts: list[str]) -> np.ndarray:
         payload = {
             "model": self.model,
-            "input": texts  # The API accepts a string or a list under "input"
+            "input": texts,
+            "keep_alive": get_keep_alive(self.model)
         }
         try:
-            with httpx.Client(timeout=30.0) as client:
-                response = client.post(self.api_url, json=payload)
-                response.raise_for_status()
-                data = response.json()
-                # First try "embedding", then fall back to "embeddings".
-                embedding = data.get("embedding")
-                if embedding is None:
-                    embedding = data.get("embeddings")
-                    if embedding is None:
-                        raise Exception(f"Missing 'embedding' key in response: {data}")
-                # Return a numpy array (assuming a list or list of lists structure)
-                return np.array(embedding)
+            client = get_async_client()
+            response = await client.post(self.api_url, json=payload, timeout=make_timeout(EMBED_TIMEOUT))
+            response.raise_for_status()
+            return _parse_embeddings(response.json(), len(texts))
         except Exception as e:
             raise Exception(f"Failed to fetch embedding from Ollama: {e}")
 
+_measured_dims = {}
+
+def get_embedding_dimension(model: str = EMBEDDING_MODEL, probe: bool = True):
+    """
+    Returns the output dimension of an embedding model: MANDIAO_EMBEDDING_DIM if set, else the
+    length of one probe embedding (measured once per model), else the known dimension from
+    models_config. Returns None if none of these is available.
+    """
+    if EMBEDDING_DIM:
+        return EMBEDDING_DIM
+    if model in _measured_dims:
+        return _measured_dims[model]
+    if probe:
+        try:
+            _measured_dims[model] = OllamaEmbeddingWrapper(model=model)._embed_batch(["dimension probe"]).shape[1]
+            return _measured_dims[model]
+        except Exception as e:
+            print(f"Could not measure the embedding dimension of {model}: {e}")
+    return KNOWN_EMBEDDING_DIMS.get(model)
+
 def get_embedding_model():
     """
     Returns an instance of the OllamaEmbeddingWrapper which generates embeddings by calling
     the Ollama /api/embed endpoint.
     """
     return OllamaEmbeddingWrapper()
+
+def get_async_embedding_model():
+    """Returns an AsyncOllamaEmbeddingWrapper for use from async code."""
+    return AsyncOllamaEmbeddingWrapper()
@@ -0,0 +1,89 @@
+# backend/pdf_helper/filters.py
+from datetime import datetime
+from pathlib import Path
+
+# Keys accepted in a retrieval filter:
+#   source          one file name or path, or a list of them
+#   page_from/to    inclusive page range (the page numbers shown in the retrieved context)
+#   uploaded_after  / uploaded_before   epoch seconds or ISO 8601 timestamps of the last ingest
+FILTER_KEYS = ("source", "page_from", "page_to", "uploaded_after", "uploaded_before")
+
+def _parse_time(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid timestamp {value!r}; use epoch seconds or ISO 8601")
+
+def normalize_filters(filters) -> dict:
+    """
+    Validates a filter dict (as received in a request body) and returns it with parsed values
+    and unset keys dropped. Raises ValueError on unknown keys or malformed values.
+    """
+    if not filters:
+        return {}
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+    normalized = {}
+    source = filters.get("source")
+    if source:
+        normalized["source"] = [source] if isinstance(source, str) else [str(s) for s in source]
+    for key in ("page_from", "page_to"):
+        if filters.get(key) is not None:
+            try:
+                normalized[key] = int(filters[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be an integer")
+    for key in ("uploaded_after", "uploaded_before"):
+        if filters.get(key) is not None:
+            normalized[key] = _parse_time(filters[key])
+    return normalized
+
+def _resolve_sources(db, filters: dict):
+    """Stored sources matching the source and upload-time filters, or None if neither is set."""
+    if "source" not in filters and "uploaded_after" not in filters and "uploaded_before" not in filters:
+        return None
+    if "uploaded_after" in filters or "uploaded_before" in filters:
+        rows = db.execute(
+            "SELECT source FROM documents WHERE updated_at >= ? AND updated_at <= ?",
+            (filters.get("uploaded_after", float("-inf")), filters.get("uploaded_before", float("inf")))
+        ).fetchall()
+    else:
+        rows = db.execute("SELECT DISTINCT source FROM chunk_index").fetchall()
+    sources = [row[0] for row in rows]
+    if "source" in filters:
+        # Uploads are stored under their full path; accept the bare file name as well.
+        wanted = set(filters["source"])
+        sources = [s for s in sources if s in wanted or Path(s).name in wanted]
+    return sources
+
+def scope_clause(db, filters: dict):
+    """
+    Turns normalized filters into a WHERE clause over chunk_index, answered from its
+    (source, page) index. Returns (clause, params), or None when the filters are empty.
+    """
+    if not filters:
+        return None
+    conditions, params = [], []
+    sources = _resolve_sources(db, filters)
+    if sources is not None:
+        if not sources:
+            return "0", []
+        conditions.append(f"chunk_index.source IN ({','.join('?' * len(sources))})")
+        params.extend(sources)
+    if "page_from" in filters:
+        conditions.append("chunk_index.page >= ?")
+        params.append(filters["page_from"])
+    if "page_to" in filters:
+        conditions.append("chunk_index.page <= ?")
+        params.append(filters["page_to"])
+    return " AND ".join(conditions), params
+
+def scoped_rowids(db, clause: str, params) -> list:
+    return [row[0] for row in db.execute(
+        f"SELECT vec_rowid FROM chunk_index WHERE {clause}", params
+    ).fetchall()]
@@ -0,0 +1,270 @@
+# backend/pdf_helper/jobs.py
+import os
+import json
+import time
+import uuid
+import threading
+from pathlib import Path
+from .pipeline import IngestionJob
+from .store import db_connection
+from .shards import DEFAULT_COLLECTION, collection_db_path, collection_exists
+
+# Number of ingestion jobs processed at the same time.
+INGEST_WORKERS = int(os.getenv("MANDIAO_INGEST_WORKERS", "1"))
+# How long an idle worker sleeps before checking the queue again.
+POLL_INTERVAL = 2.0
+
+_live_jobs = {}  # job id -> running IngestionJob, for live progress counters
+_live_lock = threading.Lock()
+_wakeup = threading.Condition()
+_workers = []
+
+def get_upload_dir(collection: str = DEFAULT_COLLECTION) -> Path:
+    """Uploaded PDFs are kept here until their job finishes so interrupted jobs can resume."""
+    upload_dir = Path.home() / ".mandiao" / "uploads"
+    if collection != DEFAULT_COLLECTION:
+        upload_dir = upload_dir / collection
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    return upload_dir
+
+def ensure_jobs_table(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            display_name TEXT,
+            status TEXT NOT NULL,
+            rows_written INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            report TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status, created_at)")
+    columns = {row[1] for row in db.execute("PRAGMA table_info(ingest_jobs)").fetchall()}
+    if "collection" not in columns:
+        db.execute(f"ALTER TABLE ingest_jobs ADD COLUMN collection TEXT NOT NULL DEFAULT '{DEFAULT_COLLECTION}'")
+
+def ensure_progress_table(db):
+    """
+    Per-job row counters kept inside a collection shard. Jobs for other collections write
+    their checkpoint here, in the same transaction as their rows, and ingest_jobs in
+    mandiao.db is reconciled from it.
+    """
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_progress (
+            job_id TEXT PRIMARY KEY,
+            rows_written INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+def _shard_rows_written(job_id: str, collection: str):
+    """The job's row counter from its shard, or None if the shard has none."""
+    if collection == DEFAULT_COLLECTION or not collection_exists(collection):
+        return None
+    with db_connection(collection_db_path(collection)) as db:
+        ensure_progress_table(db)
+        row = db.execute("SELECT rows_written FROM ingest_progress WHERE job_id = ?", (job_id,)).fetchone()
+    return row[0] if row else None
+
+def _reconcile_rows_written(job_id: str, collection: str):
+    """Copies a shard job's committed row count into ingest_jobs and drops the shard counter."""
+    rows = _shard_rows_written(job_id, collection)
+    if rows is None:
+        return
+    with db_connection() as db:
+        db.execute("UPDATE ingest_jobs SET rows_written = ? WHERE id = ?", (rows, job_id))
+        db.commit()
+    with db_connection(collection_db_path(collection)) as db:
+        db.execute("DELETE FROM ingest_progress WHERE job_id = ?", (job_id,))
+        db.commit()
+
+def _row_to_dict(row) -> dict:
+    (job_id, file_path, display_name, collection, status, rows_written, attempts, error, report,
+     created_at, updated_at) = row
+    result = json.loads(report) if report else {}
+    result.update({
+        "job_id": job_id,
+        "file": display_name,
+        "collection": collection,
+        "status": status,
+        "error": error,
+        "rows_written": rows_written,
+        "attempts": attempts,
+        "created_at": created_at,
+        "updated_at": updated_at
+    })
+    return result
+
+def _set_status(job_id: str, status: str, error: str = None, report: dict = None):
+    with db_connection() as db:
+        db.execute(
+            "UPDATE ingest_jobs SET status = ?, error = ?, report = COALESCE(?, report), updated_at = ? WHERE id = ?",
+            (status, error, json.dumps(report) if report is not None else None, time.time(), job_id)
+        )
+        db.commit()
+
+def find_active_job(file_path: str):
+    """Returns the id of a queued or running job for the given file, if any."""
+    with db_connection() as db:
+        ensure_jobs_table(db)
+        row = db.execute(
+            "SELECT id FROM ingest_jobs WHERE file_path = ? AND status IN ('queued', 'running')",
+            (str(file_path),)
+        ).fetchone()
+        return row[0] if row else None
+
+def submit_job(file_path: str, display_name: str = None, collection: str = DEFAULT_COLLECTION) -> str:
+    """Persists a queued ingestion job for a file in the upload dir and wakes a worker."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with db_connection() as db:
+        ensure_jobs_table(db)
+        db.execute(
+            "INSERT INTO ingest_jobs(id, file_path, display_name, collection, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+            (job_id, str(file_path), display_name or os.path.basename(file_path), collection, now, now)
+        )
+        db.commit()
+    with _wakeup:
+        _wakeup.notify()
+    return job_id
+
+def get_job_status(job_id: str):
+    """Returns the job's persisted status, overlaid with live counters while it runs."""
+    with db_connection() as db:
+        ensure_jobs_table(db)
+        row = db.execute(
+            "SELECT id, file_path, display_name, collection, status, rows_written, attempts, error, report, "
+            "created_at, updated_at "
+            "FROM ingest_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    status = _row_to_dict(row)
+    with _live_lock:
+        live = _live_jobs.get(job_id)
+    if status["status"] in ("queued", "running"):
+        shard_rows = _shard_rows_written(job_id, status["collection"])
+        if shard_rows is not None:
+            status["rows_written"] = shard_rows
+    if live is not None:
+        persisted_rows = status["rows_written"]
+        status.update(live.to_dict())
+        status["status"] = "running"
+        status["rows_written"] = persisted_rows
+    return status
+
+def list_jobs(limit: int = 50) -> list:
+    with db_connection() as db:
+        ensure_jobs_table(db)
+        rows = db.execute(
+            "SELECT id FROM ingest_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return [get_job_status(row[0]) for row in rows]
+
+def _claim_next_job():
+    """
+    Atomically moves the oldest queued job to 'running' and returns
+    (id, file_path, display_name, collection).
+    """
+    with db_connection() as db:
+        db.execute("BEGIN IMMEDIATE")
+        row = db.execute(
+            "SELECT id, file_path, display_name, collection FROM ingest_jobs WHERE status = 'queued' "
+            "ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            db.execute(
+                "UPDATE ingest_jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (time.time(), row[0])
+            )
+        db.commit()
+        return row
+
+def _checkpoint_for(job_id: str, collection: str = DEFAULT_COLLECTION):
+    def checkpoint(db, rows):
+        # Runs inside the write transaction, so the counter always matches the committed rows.
+        db.execute(
+            "UPDATE ingest_jobs SET rows_written = rows_written + ?, updated_at = ? WHERE id = ?",
+            (rows, time.time(), job_id)
+        )
+
+    def shard_checkpoint(db, rows):
+        # The job table lives in mandiao.db, not in the collection's shard, so the counter is
+        # kept in the shard's ingest_progress table, committed together with the rows.
+        db.execute(
+            "INSERT INTO ingest_progress(job_id, rows_written) VALUES (?, ?) "
+            "ON CONFLICT(job_id) DO UPDATE SET rows_written = rows_written + excluded.rows_written",
+            (job_id, rows)
+        )
+    return checkpoint if collection == DEFAULT_COLLECTION else shard_checkpoint
+
+def _run_job(job_id: str, file_path: str, display_name: str, collection: str = DEFAULT_COLLECTION):
+    if not os.path.exists(file_path):
+        _set_status(job_id, "failed", error=f"Uploaded file is missing: {file_path}")
+        return
+    if not collection_exists(collection):
+        _set_status(job_id, "failed", error=f"Collection '{collection}' no longer exists")
+        return
+    if collection != DEFAULT_COLLECTION:
+        with db_connection(collection_db_path(collection)) as db:
+            ensure_progress_table(db)
+            db.commit()
+    # Chunks committed by an earlier, interrupted attempt are skipped by the writer's
+    # dedup, so a resumed job only embeds what was not yet committed.
+    job = IngestionJob(file_path, display_name=display_name, job_id=job_id,
+                       checkpoint=_checkpoint_for(job_id, collection), db_path=collection_db_path(collection))
+    with _live_lock:
+        _live_jobs[job_id] = job
+    try:
+        job.run()
+    finally:
+        with _live_lock:
+            _live_jobs.pop(job_id, None)
+    _reconcile_rows_written(job_id, collection)
+    report = job.to_dict()
+    report.pop("rows_written", None)  # The persisted checkpoint counter is authoritative.
+    _set_status(job_id, job.status, error=job.error, report=report)
+    if job.status == "completed" and os.path.exists(file_path):
+        os.remove(file_path)
+
+def _worker_loop():
+    while True:
+        try:
+            claimed = _claim_next_job()
+        except Exception as e:
+            print(f"Ingestion worker error: {e}")
+            claimed = None
+        if claimed is None:
+            with _wakeup:
+                _wakeup.wait(timeout=POLL_INTERVAL)
+            continue
+        try:
+            _run_job(*claimed)
+        except Exception as e:
+            print(f"Ingestion job {claimed[0]} crashed: {e}")
+            _set_status(claimed[0], "failed", error=str(e))
+
+def start_job_workers(concurrency: int = INGEST_WORKERS):
+    """
+    Requeues jobs interrupted by a previous shutdown and starts the worker threads.
+    Safe to call more than once; workers are only started the first time.
+    """
+    if _workers:
+        return
+    with db_connection() as db:
+        ensure_jobs_table(db)
+        resumed = db.execute(
+            "UPDATE ingest_jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+            (time.time(),)
+        ).rowcount
+        db.commit()
+    if resumed:
+        print(f"Resuming {resumed} interrupted ingestion job(s).")
+    for i in range(max(1, concurrency)):
+        worker = threading.Thread(target=_worker_loop, daemon=True, name=f"ingest-worker-{i}")
+        worker.start()
+        _workers.append(worker)
@@ -0,0 +1,64 @@
+# backend/pdf_helper/lexical.py
+import re
+import sqlite3
+
+# Full-text index over chunk text. Its rowids mirror vec_items/chunk_index rowids. The trigram
+# tokenizer matches substrings, so part numbers, error codes and CJK text without word
+# boundaries can all be found; terms shorter than three characters cannot be matched.
+# SQLite older than 3.34 has no trigram tokenizer; the index then falls back to whole-word
+# unicode61 tokens.
+FTS_TOKENIZER = "trigram"
+FTS_FALLBACK_TOKENIZER = "unicode61"
+MIN_TERM_LENGTH = 3
+
+_TERM_PATTERN = re.compile(r"\w[\w.\-/]*\w|\w", re.UNICODE)
+
+def ensure_fts_table(db):
+    """Creates the chunk_fts FTS5 table and backfills it from vec_items when it is empty."""
+    try:
+        db.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5(text, tokenize='{FTS_TOKENIZER}')")
+    except sqlite3.OperationalError as e:
+        print(f"Full-text index cannot use the {FTS_TOKENIZER} tokenizer ({e}); "
+              f"falling back to {FTS_FALLBACK_TOKENIZER}, which only matches whole words.")
+        db.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5(text, tokenize='{FTS_FALLBACK_TOKENIZER}')")
+    if db.execute("SELECT 1 FROM chunk_fts LIMIT 1").fetchone() is None:
+        db.execute("INSERT INTO chunk_fts(rowid, text) SELECT rowid, text FROM vec_items")
+
+def index_chunk_text(db, rows):
+    """Adds (rowid, text) rows to the full-text index; runs inside the caller's transaction."""
+    db.executemany("INSERT INTO chunk_fts(rowid, text) VALUES (?, ?)", rows)
+
+def delete_chunk_text(db, rowids):
+    db.executemany("DELETE FROM chunk_fts WHERE rowid = ?", [(rowid,) for rowid in rowids])
+
+def query_terms(query: str) -> list:
+    """Distinct searchable terms of a query, in order of first appearance."""
+    terms = []
+    for term in _TERM_PATTERN.findall(query.casefold()):
+        if len(term) >= MIN_TERM_LENGTH and term not in terms:
+            terms.append(term)
+    return terms
+
+def build_match_query(terms, match_all: bool = False) -> str:
+    """FTS5 MATCH expression with every term quoted as a phrase, joined by AND or OR."""
+    phrases = ['"' + term.replace('"', '""') + '"' for term in terms]
+    return (" AND " if match_all else " OR ").join(phrases)
+
+def lexical_search(db, query: str, limit: int, match_all: bool = False, scope=None) -> list:
+    """
+    BM25-ranked full-text search. Returns (id, text, source, page, score) rows, best first;
+    score is the FTS5 bm25() value, where lower (more negative) is a better match.
+    scope is an optional (clause, params) condition on chunk_index from filters.scope_clause.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    clause, params = scope if scope else ("1", [])
+    return db.execute(f"""
+        SELECT chunk_index.id, chunk_fts.text, chunk_index.source, chunk_index.page, chunk_fts.rank
+        FROM chunk_fts
+        JOIN chunk_index ON chunk_index.vec_rowid = chunk_fts.rowid
+        WHERE chunk_fts MATCH ? AND ({clause})
+        ORDER BY chunk_fts.rank
+        LIMIT ?
+    """, (build_match_query(terms, match_all), *params, limit)).fetchall()
@@ -1,12 +1,71 @@
 # backend/pdf_helper/parse.py
+import os
+from concurrent.futures import ProcessPoolExecutor
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
 from langchain_community.document_loaders import PyPDFLoader
 
-def load_documents(file_name):
+# PDFs with at least this many pages are parsed by a process pool; smaller files are not
+# worth the pool start-up cost. PARSE_SHARD_PAGES is the number of pages per pool task.
+PARALLEL_PARSE_MIN_PAGES = int(os.getenv("MANDIAO_PARALLEL_PARSE_MIN_PAGES", "100"))
+PARSE_WORKERS = int(os.getenv("MANDIAO_PARSE_WORKERS", str(os.cpu_count() or 1)))
+PARSE_SHARD_PAGES = int(os.getenv("MANDIAO_PARSE_SHARD_PAGES", "16"))
+
+def _extract_page_range(file_name: str, start: int, stop: int) -> list[tuple[str, str]]:
+    """
+    Process-pool worker: extracts the text and page label of pages [start, stop).
+    Mirrors PyPDFParser's default text extraction so the output matches PyPDFLoader.
+    """
+    import pypdf
+    reader = pypdf.PdfReader(file_name)
+    results = []
+    for page_number in range(start, stop):
+        page = reader.pages[page_number]
+        if pypdf.__version__.startswith("3"):
+            text = page.extract_text()
+        else:
+            text = page.extract_text(extraction_mode="plain")
+        results.append((text.strip(), reader.page_labels[page_number]))
+    return results
+
+def _count_pages(file_name: str) -> int:
+    import pypdf
+    return len(pypdf.PdfReader(file_name).pages)
+
+def _iter_documents_parallel(file_name: str, total_pages: int, workers: int):
+    """
+    Shards the page range across a process pool and yields Documents in page order.
+    Metadata is copied from PyPDFLoader's first page so source/page fields stay identical.
+    """
+    first_page = next(PyPDFLoader(file_name).lazy_load())
+    yield first_page
+    base_metadata = {k: v for k, v in first_page.metadata.items() if k not in ("page", "page_label")}
+    shards = [(start, min(start + PARSE_SHARD_PAGES, total_pages))
+              for start in range(1, total_pages, PARSE_SHARD_PAGES)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_extract_page_range, file_name, start, stop) for start, stop in shards]
+        # Consume results in submission order so pages are reassembled in order.
+        for (start, _), future in zip(shards, futures):
+            for offset, (text, page_label) in enumerate(future.result()):
+                metadata = dict(base_metadata, page=start + offset, page_label=page_label)
+                yield Document(page_content=text, metadata=metadata)
+
+def iter_documents(file_name, workers: int = None):
+    """
+    Yields the PDF pages one Document at a time instead of loading the whole file.
+    Large PDFs are parsed in parallel across `workers` processes (PARSE_WORKERS by default).
+    """
+    workers = PARSE_WORKERS if workers is None else workers
+    if workers > 1:
+        total_pages = _count_pages(file_name)
+        if total_pages >= max(PARALLEL_PARSE_MIN_PAGES, 2):
+            yield from _iter_documents_parallel(file_name, total_pages, workers)
+            return
     loader = PyPDFLoader(file_name)
-    documents = loader.load()
-    return documents
+    yield from loader.lazy_load()
+
+def load_documents(file_name, workers: int = None):
+    return list(iter_documents(file_name, workers=workers))
 
 def split_documents(documents: list[Document]):
     text_splitter = RecursiveCharacterTextSplitter(
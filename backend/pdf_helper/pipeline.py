@@ -0,0 +1,262 @@
+# backend/pdf_helper/pipeline.py
+import os
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .parse import iter_documents, split_documents, calculate_chunk_ids
+from .embed_model import get_embedding_model, EMBED_BATCH_SIZE, EMBED_MAX_IN_FLIGHT
+from .embed_cache import cached_encode
+from .store import (db_connection, ensure_vec_table, find_existing_ids, write_chunks,
+                    delete_page_chunks, summarize_timings, WRITE_BATCH_SIZE)
+from .registry import file_sha256, page_sha256, get_file_hash, get_page_hashes, record_document
+
+# Capacity of the queues between stages; bounds how much of a PDF is held in memory.
+PIPELINE_QUEUE_SIZE = int(os.getenv("MANDIAO_PIPELINE_QUEUE_SIZE", "8"))
+
+_DONE = object()  # Sentinel passed downstream once a stage has no more items.
+
+class IngestionJob:
+    """
+    Streams a PDF through parse -> split -> embed -> insert. Every stage runs in its own
+    thread(s) and hands work to the next one through a bounded queue, so embedding and
+    insertion start while later pages are still being parsed.
+
+    The document registry makes re-ingestion incremental: a file whose hash is unchanged is
+    not parsed at all, and for a revised file only pages whose text hash changed are split
+    and embedded again, after their stale rows are removed.
+    """
+
+    def __init__(self, file_name: str, display_name: str = None, cleanup: bool = False,
+                 batch_size: int = EMBED_BATCH_SIZE, max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+                 job_id: str = None, checkpoint=None, db_path=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.file_name = file_name
+        self.db_path = db_path
+        self.display_name = display_name or os.path.basename(file_name)
+        self.cleanup = cleanup
+        self.checkpoint = checkpoint
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.status = "queued"
+        self.error = None
+        self.total_pages = None
+        self.pages_parsed = 0
+        self.chunks_split = 0
+        self.chunks_skipped = 0
+        self.chunks_embedded = 0
+        self.rows_written = 0
+        self.rows_deleted = 0
+        self.unchanged = False
+        self.pages_unchanged = 0
+        self.pages_changed = 0
+        self.file_hash = None
+        self.previous_page_hashes = {}
+        self.page_hashes = {}
+        self.commit_timings = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._failed = threading.Event()
+
+    def to_dict(self) -> dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.id,
+            "file": self.display_name,
+            "status": self.status,
+            "error": self.error,
+            "total_pages": self.total_pages,
+            "pages_parsed": self.pages_parsed,
+            "chunks_split": self.chunks_split,
+            "chunks_skipped": self.chunks_skipped,
+            "chunks_embedded": self.chunks_embedded,
+            "rows_written": self.rows_written,
+            "rows_deleted": self.rows_deleted,
+            "unchanged": self.unchanged,
+            "pages_unchanged": self.pages_unchanged,
+            "pages_changed": self.pages_changed,
+            "commits": summarize_timings(self.commit_timings),
+            "seconds": round(elapsed, 3) if elapsed is not None else None,
+            "chunks_per_second": round(self.chunks_embedded / elapsed, 2) if elapsed else 0.0
+        }
+
+    def _fail(self, error: Exception):
+        with self._lock:
+            if self.error is None:
+                self.error = str(error)
+        self._failed.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocks until the item is queued; gives up (returns False) once the job has failed."""
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._failed.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _parse_stage(self, pages: queue.Queue):
+        try:
+            for page in iter_documents(self.file_name):
+                if self.total_pages is None:
+                    self.total_pages = page.metadata.get("total_pages")
+                self.pages_parsed += 1
+                page_number = page.metadata.get("page")
+                page_hash = page_sha256(page.page_content)
+                self.page_hashes[page_number] = page_hash
+                if self.previous_page_hashes.get(page_number) == page_hash:
+                    # Same text as the last ingested version; its chunks are already stored.
+                    self.pages_unchanged += 1
+                    continue
+                if not self._put(pages, page):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(pages, _DONE)
+
+    def _split_stage(self, pages: queue.Queue, batches: queue.Queue):
+        pending = []
+        try:
+            with db_connection(self.db_path) as db:
+                while True:
+                    page = self._get(pages)
+                    if page is _DONE:
+                        break
+                    page_number = page.metadata.get("page")
+                    if page_number in self.previous_page_hashes:
+                        # The page's text changed: drop its stale rows before the new chunks are written.
+                        self.pages_changed += 1
+                        self.rows_deleted += delete_page_chunks(db, self.file_name, [page_number])
+                        db.commit()
+                    # Chunk indices restart on every page, so ids can be computed page by page.
+                    chunks = calculate_chunk_ids(split_documents([page]))
+                    self.chunks_split += len(chunks)
+                    existing_ids = find_existing_ids(db, [chunk.metadata["id"] for chunk in chunks])
+                    for chunk in chunks:
+                        if chunk.metadata["id"] in existing_ids:
+                            self.chunks_skipped += 1
+                            continue
+                        pending.append(chunk)
+                        if len(pending) >= self.batch_size:
+                            if not self._put(batches, pending):
+                                return
+                            pending = []
+                if pending:
+                    self._put(batches, pending)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # One sentinel per embedding worker.
+            for _ in range(self.max_in_flight):
+                self._put(batches, _DONE)
+
+    def _embed_stage(self, batches: queue.Queue, rows: queue.Queue):
+        model = get_embedding_model()
+        try:
+            while True:
+                batch = self._get(batches)
+                if batch is _DONE:
+                    break
+                embeddings = cached_encode(model, [chunk.page_content for chunk in batch],
+                                           batch_size=self.batch_size)
+                with self._lock:
+                    self.chunks_embedded += len(batch)
+                mapped = {chunk.metadata["id"]: embedding for chunk, embedding in zip(batch, embeddings)}
+                if not self._put(rows, (batch, mapped)):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(rows, _DONE)
+
+    def _write_stage(self, rows: queue.Queue):
+        finished_embedders = 0
+        try:
+            with db_connection(self.db_path) as db:
+                while finished_embedders < self.max_in_flight:
+                    item = self._get(rows)
+                    if item is _DONE:
+                        if self._failed.is_set():
+                            break
+                        finished_embedders += 1
+                        continue
+                    chunks, embeddings = list(item[0]), dict(item[1])
+                    # Coalesce whatever else is already queued into one larger write batch.
+                    while len(chunks) < WRITE_BATCH_SIZE:
+                        try:
+                            extra = rows.get_nowait()
+                        except queue.Empty:
+                            break
+                        if extra is _DONE:
+                            finished_embedders += 1
+                            continue
+                        chunks.extend(extra[0])
+                        embeddings.update(extra[1])
+                    timings = write_chunks(db, chunks, embeddings, checkpoint=self.checkpoint)
+                    self.commit_timings.extend(timings)
+                    self.rows_written += sum(t["rows"] for t in timings)
+        except Exception as e:
+            self._fail(e)
+
+    def _finish_registry(self):
+        """Removes rows of pages the revision no longer has and records the new file/page hashes."""
+        with db_connection(self.db_path) as db:
+            removed_pages = [page for page in self.previous_page_hashes if page not in self.page_hashes]
+            if removed_pages:
+                self.rows_deleted += delete_page_chunks(db, self.file_name, removed_pages)
+            record_document(db, self.file_name, self.file_hash, self.page_hashes)
+            db.commit()
+
+    def run(self):
+        """Runs all stages to completion on background threads and blocks until they finish."""
+        self.status = "running"
+        self.started_at = time.time()
+        try:
+            with db_connection(self.db_path) as db:
+                ensure_vec_table(db)
+                db.commit()
+                self.file_hash = file_sha256(self.file_name)
+                if get_file_hash(db, self.file_name) == self.file_hash:
+                    self.unchanged = True
+                else:
+                    self.previous_page_hashes = get_page_hashes(db, self.file_name)
+            if self.unchanged:
+                print(f"{self.display_name} is unchanged since its last ingestion; skipping.")
+                return
+            pages = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+            batches = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+            rows = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+            with ThreadPoolExecutor(max_workers=3 + self.max_in_flight,
+                                    thread_name_prefix=f"ingest-{self.id[:8]}") as executor:
+                executor.submit(self._parse_stage, pages)
+                executor.submit(self._split_stage, pages, batches)
+                for _ in range(self.max_in_flight):
+                    executor.submit(self._embed_stage, batches, rows)
+                executor.submit(self._write_stage, rows)
+            if not self._failed.is_set():
+                self._finish_registry()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self.finished_at = time.time()
+            self.status = "failed" if self._failed.is_set() else "completed"
+            if self.cleanup and os.path.exists(self.file_name):
+                os.remove(self.file_name)
+            report = self.to_dict()
+            print(f"ingestion job {self.id} {self.status}: {report['rows_written']} rows written in "
+                  f"{report['seconds']}s ({report['chunks_per_second']} chunks/s, batch_size={self.batch_size})")
@@ -0,0 +1,99 @@
+# backend/pdf_helper/query_cache.py
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("MANDIAO_QUERY_CACHE_MAX_ENTRIES", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("MANDIAO_QUERY_CACHE_TTL", "3600"))
+
+def normalize_query(query: str) -> str:
+    """Folds width/case variants and collapses whitespace so re-asked questions share a key."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return re.sub(r"\s+", " ", query).strip()
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU cache of query embeddings keyed by (embedding model, normalized query).
+    Entries expire after ttl seconds, and the whole cache is dropped when the embedding
+    model it was filled with differs from the one being asked for.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._model = None
+        self._entries = OrderedDict()  # key -> (stored_at, embedding)
+        self._lock = threading.Lock()
+
+    def _check_model(self, model: str):
+        if self._model != model:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._model = model
+
+    def get(self, model: str, query: str):
+        key = normalize_query(query)
+        with self._lock:
+            self._check_model(model)
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, model: str, query: str):
+        """Returns a cached, unexpired embedding without counting a hit or miss, or None."""
+        key = normalize_query(query)
+        with self._lock:
+            if self._model != model:
+                return None
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                return None
+            return entry[1]
+
+    def put(self, model: str, query: str, embedding: np.ndarray):
+        key = normalize_query(query)
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)  # Shared between requests.
+        with self._lock:
+            self._check_model(model)
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "model": self._model
+        }
+
+query_embedding_cache = QueryEmbeddingCache()
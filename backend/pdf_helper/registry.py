@@ -0,0 +1,61 @@
+# backend/pdf_helper/registry.py
+import time
+import hashlib
+
+def ensure_registry_tables(db):
+    """
+    Creates the document registry: one row per ingested file with its content hash, and one
+    row per page with the hash of its extracted text. Both are keyed by the chunk `source`.
+    """
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS documents (
+            source TEXT PRIMARY KEY,
+            file_hash TEXT NOT NULL,
+            page_count INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS document_pages (
+            source TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            page_hash TEXT NOT NULL,
+            PRIMARY KEY (source, page)
+        ) WITHOUT ROWID
+    """)
+
+def file_sha256(file_name: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def page_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def get_file_hash(db, source: str):
+    """Returns the hash of the last fully ingested version of the file, or None."""
+    row = db.execute("SELECT file_hash FROM documents WHERE source = ?", (source,)).fetchone()
+    return row[0] if row else None
+
+def get_page_hashes(db, source: str) -> dict:
+    """Returns {page number: text hash} of the last fully ingested version of the file."""
+    rows = db.execute("SELECT page, page_hash FROM document_pages WHERE source = ?", (source,)).fetchall()
+    return dict(rows)
+
+def record_document(db, source: str, file_hash: str, page_hashes: dict):
+    """Replaces the registry entry of a file after it was ingested successfully; the caller commits."""
+    db.execute("DELETE FROM document_pages WHERE source = ?", (source,))
+    db.executemany(
+        "INSERT INTO document_pages(source, page, page_hash) VALUES (?, ?, ?)",
+        [(source, page, page_hash) for page, page_hash in page_hashes.items()]
+    )
+    db.execute(
+        "INSERT OR REPLACE INTO documents(source, file_hash, page_count, updated_at) VALUES (?, ?, ?, ?)",
+        (source, file_hash, len(page_hashes), time.time())
+    )
+
+def clear_registry(db):
+    db.execute("DELETE FROM documents")
+    db.execute("DELETE FROM document_pages")
@@ -1,40 +1,214 @@
+import os
 import numpy as np
 from .embed_model import get_embedding_model
-from .store import get_db_connection
+from .embed_cache import cached_encode
+from .query_cache import query_embedding_cache
+from .store import db_connection
+from .vector_index import get_vector_index, normalize_rows, top_k_rows
+from .lexical import lexical_search, query_terms
+from .filters import scope_clause, scoped_rowids
+from .context import assemble_context
+
+# "vector" ranks by embedding similarity only, "lexical" by BM25 only, and "hybrid" fuses both
+# rankings with reciprocal rank fusion. Hybrid ranking is opt-in (MANDIAO_RETRIEVAL_MODE=hybrid
+# or a per-request mode) until its effect on answer quality has been measured.
+RETRIEVAL_MODE = os.getenv("MANDIAO_RETRIEVAL_MODE", "vector")
+# Candidates taken from each ranking before fusion, and the RRF damping constant.
+HYBRID_CANDIDATES = int(os.getenv("MANDIAO_HYBRID_CANDIDATES", "20"))
+RRF_K = 60
+# A query of at most this many terms whose terms all occur together in no more chunks than
+# requested is treated as a selective keyword lookup and answered without an embedding call.
+LEXICAL_FAST_PATH_MAX_TERMS = int(os.getenv("MANDIAO_LEXICAL_FAST_PATH_MAX_TERMS", "3"))
+# Stored embeddings scored per block when a batch of queries is matched against vec_items.
+BATCH_SCAN_ROWS = int(os.getenv("MANDIAO_BATCH_SCAN_ROWS", "4096"))
 
 def get_query_embedding(query: str) -> np.ndarray:
     """
     Encode the user's query into an embedding using the Ollama model via our wrapper.
+    Repeated questions are served from the in-memory query cache, then the on-disk embedding cache.
     """
     model = get_embedding_model()
-    return model.encode(query).astype(np.float32)
+    embedding = query_embedding_cache.get(model.model, query)
+    if embedding is None:
+        embedding = cached_encode(model, query)
+        query_embedding_cache.put(model.model, query, embedding)
+    return embedding
+
+def peek_query_embedding(query: str):
+    """
+    The query's embedding if retrieval has already computed it, else None. Never calls Ollama,
+    so callers can skip embedding-based work when retrieval did not need an embedding.
+    """
+    return query_embedding_cache.peek(get_embedding_model().model, query)
 
-def retrieve_relevant_chunks(query_embedding: np.ndarray, limit: int = 3):
+def get_query_embeddings(queries) -> np.ndarray:
     """
-    Connects to the SQLite database and retrieves the top document chunks most similar
-    to the query embedding using the cosine distance function 'vec_distance_cosine'.
+    Embeds a list of queries as a (queries, dim) matrix. Queries missing from the caches are
+    sent to Ollama together in a single /api/embed request.
     """
-    db, _ = get_db_connection()
-    sql = """
-        SELECT id, text, source, page, vec_distance_cosine(embedding, ?) AS distance
-        FROM vec_items
-        ORDER BY distance ASC
-        LIMIT ?
+    model = get_embedding_model()
+    embeddings = [query_embedding_cache.get(model.model, query) for query in queries]
+    misses = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+    if misses:
+        encoded = dict(zip(misses, cached_encode(model, misses, batch_size=len(misses))))
+        for query, embedding in encoded.items():
+            query_embedding_cache.put(model.model, query, embedding)
+        embeddings = [encoded[query] if embedding is None else embedding
+                      for query, embedding in zip(queries, embeddings)]
+    return np.vstack(embeddings).astype(np.float32)
+
+def retrieve_relevant_chunks(query_embedding: np.ndarray, limit: int = 3, filters: dict = None, db_path=None):
     """
-    cursor = db.execute(sql, (query_embedding.tobytes(), limit))
-    rows = cursor.fetchall()
-    db.close()
+    Retrieves the top document chunks most similar to the query embedding.
+    With the default "sqlite" backend this scans vec_items with the cosine distance function
+    'vec_distance_cosine'; other backends find the nearest rowids in their own index and the
+    chunk text and metadata are then read from vec_items.
+    filters (see filters.normalize_filters) are resolved against the (source, page) index of
+    chunk_index first, so a scoped query only reads the vectors of the matching chunks.
+    db_path selects the collection shard (mandiao.db by default).
+    """
+    index = get_vector_index(db_path)
+    with db_connection(db_path) as db:
+        scope = scope_clause(db, filters)
+        if index is None:
+            if scope is None:
+                sql = """
+                    SELECT id, text, source, page, vec_distance_cosine(embedding, ?) AS distance
+                    FROM vec_items
+                    ORDER BY distance ASC
+                    LIMIT ?
+                """
+                params = (query_embedding.tobytes(), limit)
+            else:
+                # CROSS JOIN keeps chunk_index as the outer loop: vec_items rows are point lookups by rowid.
+                sql = f"""
+                    SELECT v.id, v.text, v.source, v.page, vec_distance_cosine(v.embedding, ?) AS distance
+                    FROM chunk_index CROSS JOIN vec_items AS v ON v.rowid = chunk_index.vec_rowid
+                    WHERE {scope[0]}
+                    ORDER BY distance ASC
+                    LIMIT ?
+                """
+                params = (query_embedding.tobytes(), *scope[1], limit)
+            cursor = db.execute(sql, params)
+            rows = cursor.fetchall()
+            return rows
+        rowids = scoped_rowids(db, *scope) if scope else None
+    hits = index.search(query_embedding, limit, rowids)
+    return fetch_chunks(hits, db_path)
+
+def retrieve(query: str, limit: int = 3, mode: str = None, filters: dict = None, db_path=None) -> list:
+    """
+    Retrieves the top chunks for a text query as (id, text, source, page, distance) rows.
+    Rows found only by the lexical ranking have a distance of None. filters restrict both
+    rankings to matching chunks (see filters.normalize_filters).
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode == "vector":
+        return retrieve_relevant_chunks(get_query_embedding(query), limit, filters, db_path)
+    if mode == "lexical":
+        with db_connection(db_path) as db:
+            scope = scope_clause(db, filters)
+            return [(*row[:4], None) for row in lexical_search(db, query, limit, scope=scope)]
+    if mode != "hybrid":
+        raise ValueError(f"Unknown retrieval mode {mode!r}; expected vector, lexical or hybrid")
+
+    terms = query_terms(query)
+    with db_connection(db_path) as db:
+        scope = scope_clause(db, filters)
+        if 0 < len(terms) <= LEXICAL_FAST_PATH_MAX_TERMS:
+            exact = lexical_search(db, query, limit + 1, match_all=True, scope=scope)
+            if 0 < len(exact) <= limit:
+                return [(*row[:4], None) for row in exact]
+        lexical = lexical_search(db, query, max(limit, HYBRID_CANDIDATES), scope=scope)
+    vector = retrieve_relevant_chunks(get_query_embedding(query), max(limit, HYBRID_CANDIDATES), filters, db_path)
+    return reciprocal_rank_fusion([vector, [(*row[:4], None) for row in lexical]], limit)
+
+def reciprocal_rank_fusion(rankings, limit: int) -> list:
+    """
+    Merges ranked row lists by chunk id with score sum(1 / (RRF_K + rank)). A chunk keeps the
+    first row seen for it, so the vector ranking should come first to preserve distances.
+    """
+    scores, rows = {}, {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            scores[row[0]] = scores.get(row[0], 0.0) + 1.0 / (RRF_K + rank)
+            rows.setdefault(row[0], row)
+    best = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [rows[chunk_id] for chunk_id in best]
+
+def retrieve_batch(query_embeddings: np.ndarray, limit: int = 3, filters: dict = None, db_path=None) -> list:
+    """
+    Vector retrieval for many queries at once: the (queries, dim) matrix is scored against the
+    corpus in one pass instead of one scan per query. Returns one list of
+    (id, text, source, page, distance) rows per query.
+    """
+    queries = normalize_rows(query_embeddings)
+    index = get_vector_index(db_path)
+    with db_connection(db_path) as db:
+        scope = scope_clause(db, filters)
+        if index is None:
+            hits = _scan_batch(db, queries, limit, scope)
+        else:
+            rowids = scoped_rowids(db, *scope) if scope else None
+    if index is not None:
+        hits = index.search_many(queries, limit, rowids)
+    return [fetch_chunks(query_hits, db_path) for query_hits in hits]
+
+def _scan_batch(db, queries: np.ndarray, limit: int, scope=None) -> list:
+    """Blockwise queries x vec_items cosine distances, keeping a running top-k per query."""
+    if scope is None:
+        cursor = db.execute("SELECT rowid, embedding FROM vec_items")
+    else:
+        cursor = db.execute(f"""
+            SELECT v.rowid, v.embedding
+            FROM chunk_index CROSS JOIN vec_items AS v ON v.rowid = chunk_index.vec_rowid
+            WHERE {scope[0]}
+        """, scope[1])
+    best_rowids = np.empty((len(queries), 0), dtype=np.int64)
+    best_distances = np.empty((len(queries), 0), dtype=np.float32)
+    while True:
+        rows = cursor.fetchmany(BATCH_SCAN_ROWS)
+        if not rows:
+            break
+        rowids = np.array([row[0] for row in rows], dtype=np.int64)
+        block = normalize_rows(np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]))
+        distances = np.hstack([best_distances, 1.0 - queries @ block.T])
+        candidates = np.hstack([np.broadcast_to(best_rowids, (len(queries), best_rowids.shape[1])),
+                                np.broadcast_to(rowids, (len(queries), len(rowids)))])
+        order = top_k_rows(distances, limit)
+        best_rowids = np.take_along_axis(candidates, order, axis=1)
+        best_distances = np.take_along_axis(distances, order, axis=1)
+    return [[(int(rowid), float(distance)) for rowid, distance in zip(row_ids, row_distances)]
+            for row_ids, row_distances in zip(best_rowids, best_distances)]
+
+def fetch_chunks(hits, db_path=None) -> list:
+    """Turns [(rowid, distance)] hits into (id, text, source, page, distance) rows, in hit order."""
+    rows = []
+    with db_connection(db_path) as db:
+        for rowid, distance in hits:
+            row = db.execute("SELECT id, text, source, page FROM vec_items WHERE rowid = ?", (rowid,)).fetchone()
+            # Skip hits whose row was deleted after the index was last synced.
+            if row is not None:
+                rows.append((*row, distance))
     return rows
 
-def build_contextual_prompt(user_query: str, chunks) -> str:
+def build_contextual_prompt(user_query: str, chunks, token_budget: int = None) -> str:
     """
     Constructs an augmented prompt by including the retrieved document context and the user query.
     """
-    context_lines = []
-    for row in chunks:
-        doc_id, text, source, page, distance = row
-        context_lines.append(f"Source: {source}, Page: {page}:\n{text}")
-    context = "\n\n".join(context_lines) if context_lines else "No relevant context found."
+    return build_contextual_prompt_with_stats(user_query, chunks, token_budget)[0]
+
+def _format_history(history) -> str:
+    return "".join(f"User: {user}\nAssistant: {assistant}\n\n" for user, assistant in history or ())
+
+def build_contextual_prompt_with_stats(user_query: str, chunks, token_budget: int = None, history=None):
+    """
+    build_contextual_prompt() that also returns the context builder's stats. Overlapping and
+    same-page chunks are merged and the context is fitted into the token budget
+    (see context.assemble_context). history is an optional list of earlier (user, assistant)
+    turns placed before the current question.
+    """
+    context, stats = assemble_context(chunks, token_budget)
     prompt = f"""### System Instruction:
 You are Deepseek-R1, a helpful AI assistant. Use the following context to answer the user's query as accurately as possible.
 
@@ -42,8 +216,26 @@ You are Deepseek-R1, a helpful AI assistant. Use the following context to answer
 {context}
 
 ### Current Conversation:
+{_format_history(history)}User: {user_query}
+
+### Assistant Response:
+"""
+    return prompt, stats
+
+def build_followup_prompt(user_query: str, chunks, token_budget: int = None):
+    """
+    Prompt for a follow-up turn sent together with Ollama's `context` from the previous
+    turn: the model has already seen the instruction, earlier turns and earlier chunks, so
+    only newly retrieved chunks and the new question are included. Returns (prompt, stats).
+    """
+    if chunks:
+        context, stats = assemble_context(chunks, token_budget)
+        context_block = f"### Additional Context:\n{context}\n\n"
+    else:
+        context_block, stats = "", assemble_context([], token_budget)[1]
+    prompt = f"""{context_block}### Current Conversation:
 User: {user_query}
 
 ### Assistant Response:
 """
-    return prompt
\ No newline at end of file
+    return prompt, stats
\ No newline at end of file
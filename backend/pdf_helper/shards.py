@@ -0,0 +1,134 @@
+# backend/pdf_helper/shards.py
+import os
+import re
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from .store import get_db_path, db_connection, initialize_database, clear_sqlite_database, close_pool
+from .vector_index import discard_vector_indexes
+from .retrieval import (retrieve, retrieve_batch, reciprocal_rank_fusion, get_query_embedding,
+                        RETRIEVAL_MODE)
+
+# Every collection is its own SQLite shard file. "default" is ~/.mandiao/mandiao.db, so
+# existing installs keep their data; other collections live in ~/.mandiao/collections/<name>.db.
+DEFAULT_COLLECTION = "default"
+# Threads used to search several shards at once.
+FANOUT_WORKERS = int(os.getenv("MANDIAO_FANOUT_WORKERS", "8"))
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_collections_dir() -> Path:
+    collections_dir = Path.home() / ".mandiao" / "collections"
+    collections_dir.mkdir(parents=True, exist_ok=True)
+    return collections_dir
+
+def validate_collection_name(name: str) -> str:
+    if not isinstance(name, str) or not _NAME_PATTERN.match(name):
+        raise ValueError("Collection names use 1-64 letters, digits, '-' or '_' and start with a letter or digit.")
+    return name
+
+def collection_db_path(name: str) -> Path:
+    if validate_collection_name(name) == DEFAULT_COLLECTION:
+        return get_db_path()
+    return get_collections_dir() / f"{name}.db"
+
+def collection_exists(name: str) -> bool:
+    return name == DEFAULT_COLLECTION or collection_db_path(name).exists()
+
+def resolve_collections(names=None) -> list:
+    """
+    Maps a collection name or list of names (default: the default collection) to
+    [(name, db_path)]. Raises ValueError for invalid names and LookupError for unknown ones.
+    """
+    if names is None or names == []:
+        names = [DEFAULT_COLLECTION]
+    elif isinstance(names, str):
+        names = [names]
+    resolved = []
+    for name in dict.fromkeys(names):
+        db_path = collection_db_path(name)
+        if not collection_exists(name):
+            raise LookupError(f"Unknown collection '{name}'")
+        resolved.append((name, db_path))
+    return resolved
+
+def list_collections() -> list:
+    names = [DEFAULT_COLLECTION] + sorted(path.stem for path in get_collections_dir().glob("*.db"))
+    collections = []
+    for name in names:
+        db_path = collection_db_path(name)
+        with db_connection(db_path) as db:
+            chunks = db.execute("SELECT COUNT(*) FROM chunk_index").fetchone()[0]
+            documents = db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        collections.append({
+            "name": name,
+            "chunks": chunks,
+            "documents": documents,
+            "bytes": db_path.stat().st_size if db_path.exists() else 0
+        })
+    return collections
+
+def create_collection(name: str) -> Path:
+    db_path = collection_db_path(name)
+    if collection_exists(name):
+        raise FileExistsError(f"Collection '{name}' already exists")
+    initialize_database(db_path)
+    return db_path
+
+def drop_collection(name: str):
+    """Deletes a collection's shard file and its secondary indexes. The default collection can only be cleared."""
+    if validate_collection_name(name) == DEFAULT_COLLECTION:
+        raise ValueError("The default collection cannot be dropped; clear it instead.")
+    if not collection_exists(name):
+        raise LookupError(f"Unknown collection '{name}'")
+    db_path = collection_db_path(name)
+    discard_vector_indexes(db_path)
+    close_pool(db_path)
+    for suffix in ("", "-wal", "-shm"):
+        path = Path(f"{db_path}{suffix}")
+        if path.exists():
+            path.unlink()
+
+def clear_collection(name: str = DEFAULT_COLLECTION):
+    (_, db_path), = resolve_collections(name)
+    return clear_sqlite_database(db_path)
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, FANOUT_WORKERS), thread_name_prefix="shard-search")
+        return _executor
+
+def _fan_out(task, collections) -> list:
+    """Runs task(db_path) for every collection, in parallel when there is more than one."""
+    if len(collections) == 1:
+        return [task(collections[0][1])]
+    futures = [_get_executor().submit(task, db_path) for _, db_path in collections]
+    return [future.result() for future in futures]
+
+def _merge(rankings, limit: int, by_distance: bool) -> list:
+    if by_distance:
+        rows = [row for ranking in rankings for row in ranking]
+        return sorted(rows, key=lambda row: row[4])[:limit]
+    # Hybrid and lexical rankings have no common distance scale across shards.
+    return reciprocal_rank_fusion(rankings, limit)
+
+def search_collections(query: str, collections, limit: int = 3, mode: str = None, filters: dict = None) -> list:
+    """
+    retrieve() over one or more collections. Each shard is searched on its own thread with
+    its own pooled connection, and the per-shard top-k lists are merged.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if len(collections) > 1 and mode != "lexical":
+        # Embed once up front so the shards share the cached query embedding.
+        get_query_embedding(query)
+    rankings = _fan_out(lambda db_path: retrieve(query, limit, mode, filters, db_path), collections)
+    return _merge(rankings, limit, by_distance=(mode == "vector"))
+
+def search_collections_batch(query_embeddings, collections, limit: int = 3, filters: dict = None) -> list:
+    """retrieve_batch() over one or more collections; returns one merged row list per query."""
+    per_shard = _fan_out(lambda db_path: retrieve_batch(query_embeddings, limit, filters, db_path), collections)
+    return [_merge(rankings, limit, by_distance=True) for rankings in zip(*per_shard)]
@@ -1,11 +1,34 @@
+import re
 import sqlite3
+import time
+import queue
+import threading
+from contextlib import contextmanager
 import numpy as np
 from pathlib import Path
 from langchain.schema.document import Document
-from .embed_model import get_embedding_model
+from .embed_model import get_embedding_model, get_embedding_dimension, EMBED_BATCH_SIZE, EMBED_MAX_IN_FLIGHT
+from .embed_cache import cached_encode
 from .parse import calculate_chunk_ids
+from .registry import ensure_registry_tables, clear_registry
+from .lexical import ensure_fts_table, index_chunk_text, delete_chunk_text
+import os
 import sys
 
+# Rows per executemany/transaction in the vec_items writer, and ids per dedup lookup.
+WRITE_BATCH_SIZE = int(os.getenv("MANDIAO_WRITE_BATCH_SIZE", "256"))
+LOOKUP_BATCH_SIZE = 500
+# vec_items dimension used when the embedding model's dimension cannot be determined.
+FALLBACK_EMBEDDING_DIM = 768
+# Idle connections kept per database file, and the pragmas applied to every new connection.
+DB_POOL_SIZE = int(os.getenv("MANDIAO_DB_POOL_SIZE", "8"))
+CONNECTION_PRAGMAS = (
+    "PRAGMA busy_timeout = 30000",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -32000",
+)
+
 if getattr(sys, 'frozen', False):
     base = Path(sys._MEIPASS)
     print("sys._MEIPASS is located at:", base)
@@ -14,89 +37,366 @@ if getattr(sys, 'frozen', False):
 else:
     print("Application is not frozen; not using sys._MEIPASS.")
 
-def get_db_connection():
+def get_db_path() -> Path:
     home_dir = Path.home()
     app_data_dir = home_dir / ".mandiao"
     app_data_dir.mkdir(exist_ok=True)
-    db_path = app_data_dir / "mandiao.db"
-    db = sqlite3.connect(str(db_path))
+    return app_data_dir / "mandiao.db"
+
+def _get_extension_file() -> Path:
+    if getattr(sys, 'frozen', False):
+        ext_path = Path(sys._MEIPASS) / "backend" / "pdf_helper"
+    else:
+        ext_path = Path(__file__).parent
+    return ext_path / "vec0.dll"  # Adjust filename if needed.
+
+def get_db_connection(db_path: Path = None, verbose: bool = True):
+    """
+    Opens a new connection with sqlite-vec loaded and the connection pragmas applied.
+    Most callers should borrow a pooled connection through db_connection() instead.
+    """
+    db_path = Path(db_path) if db_path is not None else get_db_path()
+    db = sqlite3.connect(str(db_path), timeout=30.0, check_same_thread=False)
     db.enable_load_extension(True)
    
     try:
-        if getattr(sys, 'frozen', False):
-            ext_path = Path(sys._MEIPASS) / "backend" / "pdf_helper"
-        else:
-            ext_path = Path(__file__).parent
-        extension_file = ext_path / "vec0.dll"  # Adjust filename if needed.
-        print("Attempting to load sqlite-vec extension from:", extension_file)
+        extension_file = _get_extension_file()
+        if verbose:
+            print("Attempting to load sqlite-vec extension from:", extension_file)
         
         if not extension_file.exists():
             raise FileNotFoundError(f"{extension_file} does not exist.")
         
         db.load_extension(str(extension_file))
-        print("sqlite-vec extension loaded successfully.")
+        if verbose:
+            print("sqlite-vec extension loaded successfully.")
     except Exception as e:
         print("Failed to load sqlite-vec extension:", e)
     finally:
         db.enable_load_extension(False)
+    for pragma in CONNECTION_PRAGMAS:
+        db.execute(pragma)
     return db, db_path
 
-def initialize_database():
+class ConnectionPool:
+    """
+    Keeps ready-to-use connections (sqlite-vec loaded, pragmas applied) for one database file.
+    Connections are opened on demand and up to max_idle of them are kept for reuse, so the
+    hot path never pays for opening a connection or loading the extension.
+    """
+
+    def __init__(self, db_path: Path, max_idle: int = DB_POOL_SIZE):
+        self.db_path = Path(db_path)
+        self.max_idle = max_idle
+        self.opened = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.opened += 1
+                verbose = self.opened == 1
+            db, _ = get_db_connection(self.db_path, verbose=verbose)
+            return db
+
+    def _release(self, db):
+        if db.in_transaction:
+            # Never hand out a connection with somebody else's uncommitted work.
+            db.rollback()
+        if self._idle.qsize() < self.max_idle:
+            self._idle.put(db)
+        else:
+            db.close()
+
+    @contextmanager
+    def connection(self):
+        db = self._acquire()
+        try:
+            yield db
+        except Exception:
+            db.close()
+            raise
+        else:
+            self._release(db)
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: Path = None) -> ConnectionPool:
+    """Returns the connection pool of a database file (mandiao.db by default)."""
+    db_path = Path(db_path) if db_path is not None else get_db_path()
+    key = str(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+        return pool
+
+def close_pool(db_path: Path):
+    """Closes the idle connections of a database file and forgets its pool (e.g. before deleting it)."""
+    with _pools_lock:
+        pool = _pools.pop(str(Path(db_path)), None)
+    if pool is not None:
+        pool.close_all()
+
+def db_connection(db_path: Path = None):
+    """
+    Context manager that borrows a pooled connection:
+
+        with db_connection() as db:
+            db.execute(...)
+
+    Uncommitted work is rolled back when the connection is returned.
+    """
+    return get_pool(db_path).connection()
+
+# Objects notified after vec_items changes, e.g. to keep a secondary vector index in sync.
+# A listener implements on_insert(db_path, rowids, embeddings), on_delete(db_path, rowids)
+# and on_clear(db_path).
+_change_listeners = []
+
+def add_change_listener(listener):
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+def _notify(event: str, db, *args):
+    if not _change_listeners:
+        return
+    db_path = Path(db.execute("PRAGMA database_list").fetchone()[2])
+    for listener in _change_listeners:
+        try:
+            getattr(listener, event)(db_path, *args)
+        except Exception as e:
+            print(f"Change listener {listener!r} failed on {event}: {e}")
+
+def get_vec_dimension(db):
+    """Embedding dimension declared by the existing vec_items table, or None if there is none."""
+    row = db.execute("SELECT sql FROM sqlite_master WHERE name = 'vec_items'").fetchone()
+    match = re.search(r"float\[(\d+)\]", row[0]) if row else None
+    return int(match.group(1)) if match else None
+
+def ensure_vec_table(db):
+    """
+    Creates the vec_items virtual table and its chunk_index companion if they do not exist yet.
+    chunk_index is a plain table with an indexed id column that mirrors vec_items rowids, so
+    dedup and deletes are targeted lookups instead of scans over the virtual table. The
+    chunk_fts full-text index shares the same rowids.
+    The embedding column is sized for the configured embedding model. An empty vec_items of
+    another size is recreated; a populated one is kept and reported until it is cleared.
+    """
+    dim = get_embedding_dimension()
+    existing_dim = get_vec_dimension(db)
+    if existing_dim is not None and dim is not None and existing_dim != dim:
+        if db.execute("SELECT 1 FROM vec_items LIMIT 1").fetchone() is None:
+            print(f"Recreating empty vec_items for {dim}-dimensional embeddings (was {existing_dim}).")
+            db.execute("DROP TABLE vec_items")
+        else:
+            print(f"vec_items holds {existing_dim}-dimensional embeddings but the embedding model "
+                  f"produces {dim}; clear the collection to re-index it.")
+    if dim is None:
+        dim = existing_dim or FALLBACK_EMBEDDING_DIM
+        if existing_dim is None:
+            print(f"Embedding dimension unknown; creating vec_items with {dim} dimensions.")
+    db.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS vec_items 
+        USING vec0(id TEXT, text TEXT, source TEXT, page INTEGER, embedding float[{dim}] distance_metric=cosine)
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_index (
+            vec_rowid INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            source TEXT,
+            page INTEGER
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_chunk_index_source_page ON chunk_index(source, page)")
+    # Highest vec_rowid ever allocated. It survives deletes and clears, so rowids are never
+    # reused and secondary indexes can tell a replaced row from the one it replaced.
+    db.execute("CREATE TABLE IF NOT EXISTS vec_rowid_seq (last_rowid INTEGER NOT NULL)")
+    ensure_registry_tables(db)
+    # Backfill databases created before chunk_index existed.
+    if db.execute("SELECT 1 FROM chunk_index LIMIT 1").fetchone() is None:
+        db.execute("""
+            INSERT OR IGNORE INTO chunk_index(vec_rowid, id, source, page)
+            SELECT rowid, id, source, page FROM vec_items
+        """)
+    if db.execute("SELECT 1 FROM vec_rowid_seq").fetchone() is None:
+        db.execute("INSERT INTO vec_rowid_seq(last_rowid) SELECT COALESCE(MAX(vec_rowid), 0) FROM chunk_index")
+    ensure_fts_table(db)
+
+def initialize_database(db_path: Path = None):
     """
     Initializes the SQLite database by creating the vec_items table if it does not exist.
     This ensures that the chat endpoint does not error out on first run.
     """
-    db, _ = get_db_connection()
     try:
-        db.execute("""
-            CREATE VIRTUAL TABLE IF NOT EXISTS vec_items 
-            USING vec0(id TEXT, text TEXT, source TEXT, page INTEGER, embedding float[768] distance_metric=cosine)
-        """)
-        db.commit()
+        with db_connection(db_path) as db:
+            # WAL lets chat queries keep reading while an upload is writing.
+            db.execute("PRAGMA journal_mode=WAL")
+            ensure_vec_table(db)
+            db.commit()
         print("Database initialization completed.")
     except Exception as e:
         print("Database initialization error:", e)
-    finally:
-        db.close()
 
-def clear_sqlite_database():
-    db, _ = get_db_connection()
+def clear_sqlite_database(db_path: Path = None):
     try:
-        db.execute("DROP TABLE IF EXISTS vec_items")
-        db.execute("""
-            CREATE VIRTUAL TABLE IF NOT EXISTS vec_items 
-            USING vec0(id TEXT, text TEXT, source TEXT, page INTEGER, embedding float[768] distance_metric=cosine)
-        """)
-        db.commit()
+        with db_connection(db_path) as db:
+            db.execute("DROP TABLE IF EXISTS vec_items")
+            db.execute("DROP TABLE IF EXISTS chunk_index")
+            db.execute("DROP TABLE IF EXISTS chunk_fts")
+            ensure_vec_table(db)
+            clear_registry(db)
+            db.commit()
+            _notify("on_clear", db)
         return True
     except Exception as e:
         print(f"Error clearing database: {e}")
         raise
-    finally:
-        db.close()
 
-def add_to_sqlite(chunks: list[Document]):
-    db, _ = get_db_connection()
-    db.execute("""
-        CREATE VIRTUAL TABLE IF NOT EXISTS vec_items 
-        USING vec0(id TEXT, text TEXT, source TEXT, page INTEGER, embedding float[768] distance_metric=cosine)
-    """)
-    existing_items = db.execute("SELECT id FROM vec_items").fetchall()
-    existing_ids = {item[0] for item in existing_items}
-    print(f"number of existing documents in db: {len(existing_ids)}")
-    new_chunks = [chunk for chunk in chunks if chunk.metadata["id"] not in existing_ids]
-    if new_chunks:
-        print(f"adding new documents: {len(new_chunks)}")
-        for chunk in new_chunks:
-            chunk_text = chunk.page_content
-            model = get_embedding_model()
-            embedding = model.encode(chunk_text).astype(np.float32)
-            db.execute(
-                "INSERT INTO vec_items(id, text, source, page, embedding) VALUES (?, ?, ?, ?, ?)",
-                [chunk.metadata["id"], chunk_text, chunk.metadata["source"], chunk.metadata["page"], embedding]
+def find_existing_ids(db, ids) -> set:
+    """Returns the subset of the given chunk ids that are already stored, via the chunk_index index."""
+    ids = list(ids)
+    existing = set()
+    for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        batch = ids[i:i + LOOKUP_BATCH_SIZE]
+        placeholders = ",".join("?" * len(batch))
+        rows = db.execute(f"SELECT id FROM chunk_index WHERE id IN ({placeholders})", batch).fetchall()
+        existing.update(row[0] for row in rows)
+    return existing
+
+def delete_page_chunks(db, source: str, pages) -> int:
+    """
+    Deletes the stored chunks of the given pages of a source, looked up through chunk_index.
+    Returns the number of rows removed; the caller commits.
+    """
+    rowids = []
+    for page in pages:
+        rowids.extend(row[0] for row in db.execute(
+            "SELECT vec_rowid FROM chunk_index WHERE source = ? AND page = ?", (source, page)
+        ).fetchall())
+    db.executemany("DELETE FROM vec_items WHERE rowid = ?", [(rowid,) for rowid in rowids])
+    db.executemany("DELETE FROM chunk_index WHERE vec_rowid = ?", [(rowid,) for rowid in rowids])
+    delete_chunk_text(db, rowids)
+    if rowids:
+        _notify("on_delete", db, rowids)
+    return len(rowids)
+
+def write_chunks(db, chunks: list[Document], embeddings: dict, batch_size: int = WRITE_BATCH_SIZE,
+                 checkpoint=None) -> list:
+    """
+    Bulk-inserts chunks (embeddings keyed by chunk id) with executemany, one explicit
+    transaction per batch so readers are never blocked for the whole upload. Chunks whose
+    id is already stored are skipped. checkpoint(db, rows), if given, runs inside each batch
+    transaction so progress bookkeeping commits atomically with the rows.
+    Returns one {"rows", "seconds"} timing per committed batch.
+    """
+    if db.in_transaction:
+        db.commit()
+    timings = []
+    for i in range(0, len(chunks), max(1, batch_size)):
+        batch = chunks[i:i + batch_size]
+        start = time.perf_counter()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check inside the write lock in case a concurrent upload stored the same ids.
+            existing = find_existing_ids(db, [chunk.metadata["id"] for chunk in batch])
+            batch = [chunk for chunk in batch if chunk.metadata["id"] not in existing]
+            next_rowid = db.execute(
+                "SELECT MAX(COALESCE((SELECT MAX(vec_rowid) FROM chunk_index), 0), "
+                "COALESCE((SELECT last_rowid FROM vec_rowid_seq), 0)) + 1"
+            ).fetchone()[0]
+            rowids = range(next_rowid, next_rowid + len(batch))
+            db.execute("UPDATE vec_rowid_seq SET last_rowid = ?", (next_rowid + len(batch) - 1,))
+            db.executemany(
+                "INSERT INTO chunk_index(vec_rowid, id, source, page) VALUES (?, ?, ?, ?)",
+                [(rowid, chunk.metadata["id"], chunk.metadata["source"], chunk.metadata["page"])
+                 for rowid, chunk in zip(rowids, batch)]
             )
-        print("new documents added to sqlite db")
-    else:
-        print("no new documents to be added")
-    db.commit()
-    db.close()
\ No newline at end of file
+            db.executemany(
+                "INSERT INTO vec_items(rowid, id, text, source, page, embedding) VALUES (?, ?, ?, ?, ?, ?)",
+                [(rowid, chunk.metadata["id"], chunk.page_content, chunk.metadata["source"],
+                  chunk.metadata["page"], embeddings[chunk.metadata["id"]])
+                 for rowid, chunk in zip(rowids, batch)]
+            )
+            index_chunk_text(db, [(rowid, chunk.page_content) for rowid, chunk in zip(rowids, batch)])
+            if checkpoint is not None:
+                checkpoint(db, len(batch))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if batch:
+            vectors = np.array([embeddings[chunk.metadata["id"]] for chunk in batch], dtype=np.float32)
+            _notify("on_insert", db, list(rowids), vectors.reshape(len(batch), -1))
+        elapsed = time.perf_counter() - start
+        timings.append({"rows": len(batch), "seconds": round(elapsed, 4)})
+        print(f"committed {len(batch)} rows in {elapsed * 1000:.1f} ms")
+    return timings
+
+def summarize_timings(timings: list) -> dict:
+    """Aggregates per-batch commit timings for upload reports."""
+    if not timings:
+        return {"batches": 0, "avg_commit_ms": 0.0, "max_commit_ms": 0.0}
+    seconds = [t["seconds"] for t in timings]
+    return {
+        "batches": len(timings),
+        "avg_commit_ms": round(sum(seconds) / len(seconds) * 1000, 2),
+        "max_commit_ms": round(max(seconds) * 1000, 2)
+    }
+
+def embed_chunks(chunks: list[Document], batch_size: int = EMBED_BATCH_SIZE,
+                 max_in_flight: int = EMBED_MAX_IN_FLIGHT) -> dict:
+    """
+    Embeds the chunk texts in batches and maps each returned embedding row back to its chunk id.
+    Texts already in the embedding cache are not sent to Ollama again.
+    """
+    model = get_embedding_model()
+    embeddings = cached_encode(
+        model,
+        [chunk.page_content for chunk in chunks],
+        batch_size=batch_size,
+        max_in_flight=max_in_flight
+    )
+    return {chunk.metadata["id"]: embedding for chunk, embedding in zip(chunks, embeddings)}
+
+def add_to_sqlite(chunks: list[Document], batch_size: int = EMBED_BATCH_SIZE,
+                  max_in_flight: int = EMBED_MAX_IN_FLIGHT):
+    """
+    Embeds and stores the chunks that are not yet in vec_items.
+    Returns a small report with the number of chunks added, the embedding throughput
+    and the per-batch commit timings.
+    """
+    with db_connection() as db:
+        ensure_vec_table(db)
+        db.commit()
+        existing_ids = find_existing_ids(db, [chunk.metadata["id"] for chunk in chunks])
+        print(f"number of chunks already in db: {len(existing_ids)}")
+        new_chunks = [chunk for chunk in chunks if chunk.metadata["id"] not in existing_ids]
+        report = {"added": 0, "seconds": 0.0, "chunks_per_second": 0.0, "batch_size": batch_size,
+                  "commits": summarize_timings([])}
+        if new_chunks:
+            print(f"adding new documents: {len(new_chunks)}")
+            start = time.perf_counter()
+            embeddings = embed_chunks(new_chunks, batch_size=batch_size, max_in_flight=max_in_flight)
+            timings = write_chunks(db, new_chunks, embeddings)
+            elapsed = time.perf_counter() - start
+            report["added"] = sum(t["rows"] for t in timings)
+            report["seconds"] = round(elapsed, 3)
+            report["chunks_per_second"] = round(len(new_chunks) / elapsed, 2) if elapsed > 0 else 0.0
+            report["commits"] = summarize_timings(timings)
+            print(f"new documents added to sqlite db: {report['added']} chunks in {report['seconds']}s "
+                  f"({report['chunks_per_second']} chunks/s, batch_size={batch_size}, max_in_flight={max_in_flight})")
+        else:
+            print("no new documents to be added")
+        return report
@@ -0,0 +1,849 @@
+# backend/pdf_helper/vector_index.py
+import os
+import json
+import time
+import atexit
+import shutil
+import argparse
+import threading
+from pathlib import Path
+import numpy as np
+from .store import db_connection, get_db_path, get_vec_dimension, add_change_listener
+
+# Which index answers vector searches: "sqlite" scans vec_items with vec_distance_cosine,
+# "numpy" searches a memory-mapped matrix of normalized embeddings next to the database,
+# "hnsw" walks an approximate nearest-neighbour graph (requires the hnswlib package),
+# "int8"/"binary" search quantized copies of the embeddings and rescore at full precision,
+# and "reduced" does the same with a truncated or PCA-projected copy.
+# SQLite stays the source of truth for chunk text and metadata in every mode.
+RETRIEVAL_BACKEND = os.getenv("MANDIAO_RETRIEVAL_BACKEND", "sqlite").lower()
+# Rebuild the matrix files once this share of their rows are deleted tombstones.
+COMPACT_RATIO = 0.25
+# Quantized backends rescore this many candidates per requested result.
+RESCORE_FACTOR = int(os.getenv("MANDIAO_RESCORE_FACTOR", "10"))
+# Reduced-dimension first pass: rows are projected to REDUCED_DIM dimensions, either by
+# keeping the leading components ("truncate") or with a PCA projection fitted on a sample of
+# at most PCA_SAMPLE_ROWS stored embeddings ("pca"), and the candidates are re-ranked at full
+# dimension. The projection is refitted whenever the collection has doubled since the last fit.
+REDUCED_DIM = int(os.getenv("MANDIAO_REDUCED_DIM", "128"))
+REDUCED_METHOD = os.getenv("MANDIAO_REDUCED_METHOD", "pca")
+PCA_SAMPLE_ROWS = 20000
+# HNSW graph parameters: M links per node, ef during construction and search. Collections
+# smaller than HNSW_EXACT_THRESHOLD are searched exactly with vec_distance_cosine instead.
+HNSW_M = int(os.getenv("MANDIAO_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("MANDIAO_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("MANDIAO_HNSW_EF_SEARCH", "64"))
+HNSW_EXACT_THRESHOLD = int(os.getenv("MANDIAO_HNSW_EXACT_THRESHOLD", "5000"))
+# Scoped exact searches read the allowed rows by rowid while they are at most this share of
+# the collection (a point lookup costs about as much as scanning 50 rows); larger scopes
+# are answered with one pass over vec_items in blocks of SCAN_BLOCK_ROWS.
+EXACT_LOOKUP_SHARE = 0.02
+SCAN_BLOCK_ROWS = 4096
+# Minimum seconds between saves of the HNSW graph; it is also saved at exit.
+HNSW_SAVE_INTERVAL = float(os.getenv("MANDIAO_HNSW_SAVE_INTERVAL", "30"))
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def top_k(distances: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest distances in ascending order, via a partial sort."""
+    k = min(k, len(distances))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(distances, k - 1)[:k]
+    return candidates[np.argsort(distances[candidates], kind="stable")]
+
+def top_k_rows(distances: np.ndarray, k: int) -> np.ndarray:
+    """top_k for every row of a (queries, candidates) distance matrix."""
+    k = min(k, distances.shape[1])
+    if k <= 0:
+        return np.empty((len(distances), 0), dtype=np.int64)
+    candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(distances, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+def fetch_embeddings(db, rowids):
+    """
+    Reads the full-precision embeddings of the given vec_items rowids with one point lookup
+    each; vec0 answers `rowid IN (...)` with a scan of the whole table. Missing rows are
+    skipped. Returns (rowids, float32 matrix).
+    """
+    found, vectors = [], []
+    for rowid in rowids:
+        row = db.execute("SELECT embedding FROM vec_items WHERE rowid = ?", (int(rowid),)).fetchone()
+        if row is not None:
+            found.append(int(rowid))
+            vectors.append(np.frombuffer(row[0], dtype=np.float32))
+    return found, (np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32))
+
+def rescore(db, query: np.ndarray, rowids, limit: int) -> list:
+    """Exact [(rowid, cosine distance)] of the given rows to the query, closest first."""
+    found, matrix = fetch_embeddings(db, rowids)
+    if not found:
+        return []
+    distances = 1.0 - normalize_rows(matrix) @ normalize_rows(query)[0]
+    return [(found[i], float(distances[i])) for i in top_k(distances, limit)]
+
+class VectorIndex:
+    """
+    Base class of the secondary vector indexes. Subclasses keep a copy of the vec_items
+    embeddings keyed by vec_items rowid and answer nearest-neighbour queries with cosine
+    distance, like vec_distance_cosine does.
+    """
+    name = None
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._lock = threading.RLock()
+        self._synced = False
+
+    @property
+    def index_dir(self) -> Path:
+        return self.db_path.parent / f"{self.db_path.stem}.{self.name}"
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def add(self, rowids, embeddings: np.ndarray):
+        raise NotImplementedError
+
+    def remove(self, rowids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, query: np.ndarray, limit: int, rowids=None) -> list:
+        """
+        Returns [(rowid, cosine distance)] of the nearest rows, closest first. If rowids is
+        given, only those rows are candidates.
+        """
+        raise NotImplementedError
+
+    def search_many(self, queries: np.ndarray, limit: int, rowids=None) -> list:
+        """One search() result list per query row."""
+        return [self.search(query, limit, rowids) for query in np.atleast_2d(queries)]
+
+    def rowids(self):
+        """Rowids of the rows currently in the index."""
+        raise NotImplementedError
+
+    def ensure_synced(self):
+        """Resyncs the index from vec_items when its rowids disagree with chunk_index."""
+        if self._synced:
+            return
+        with self._lock:
+            if self._synced:
+                return
+            with db_connection(self.db_path) as db:
+                expected = tuple(db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(vec_rowid), 0) FROM chunk_index"
+                ).fetchone())
+            rowids = list(self.rowids())
+            # write_chunks never reuses a rowid (see vec_rowid_seq), so replacing rows raises
+            # the sum even when the count matches.
+            if expected != (len(rowids), sum(rowids)):
+                print(f"Resyncing {self.name} vector index ({len(rowids)} rows, expected {expected[0]}).")
+                self.resync()
+            self._synced = True
+
+    def resync(self):
+        self.rebuild()
+
+    def rebuild(self, batch_size: int = 4096):
+        with self._lock:
+            self.clear()
+            self._add_from_vec_items(batch_size)
+
+    def _add_from_vec_items(self, batch_size: int):
+        with self._lock:
+            with db_connection(self.db_path) as db:
+                cursor = db.execute("SELECT rowid, embedding FROM vec_items")
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    self.add([row[0] for row in rows],
+                             np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]))
+
+class NumpyMmapIndex(VectorIndex):
+    """
+    Exact search over a float32 matrix of L2-normalized embeddings stored in a flat file and
+    memory-mapped for queries; a query is one matrix-vector product plus a partial top-k.
+    Rows are appended on insert and tombstoned (rowid -1) on delete, with periodic compaction.
+    Subclasses can store a different row encoding by overriding row_dtype, _encode and _distances.
+    """
+    name = "numpy"
+    vectors_filename = "embeddings.f32"
+    row_dtype = np.float32
+
+    def __init__(self, db_path: Path):
+        super().__init__(db_path)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_file = self.index_dir / self.vectors_filename
+        self.rowids_file = self.index_dir / "rowids.i64"
+        self._load()
+
+    def _load(self):
+        self._matrix = None
+        self._rowids = np.fromfile(self.rowids_file, dtype=np.int64) if self.rowids_file.exists() \
+            else np.empty(0, dtype=np.int64)
+        count = len(self._rowids)
+        itemsize = np.dtype(self.row_dtype).itemsize
+        size = self.vectors_file.stat().st_size if self.vectors_file.exists() else 0
+        if (count and size % (count * itemsize) != 0) or (not count and size):
+            # Torn write from an earlier crash; start over and let ensure_synced rebuild.
+            self._reset_files()
+            return
+        self.width = size // (count * itemsize) if count else None
+        self._rowid_buffer = self._rowids
+        self._map_matrix()
+        self._positions = {int(rowid): i for i, rowid in enumerate(self._rowids) if rowid >= 0}
+
+    def _map_matrix(self):
+        count = len(self._rowids)
+        self._matrix = np.memmap(self.vectors_file, dtype=self.row_dtype, mode="r",
+                                 shape=(count, self.width)) if count else None
+
+    def _reset_files(self):
+        self._matrix = None
+        for path in (self.vectors_file, self.rowids_file):
+            if path.exists():
+                path.unlink()
+        self._rowids = self._rowid_buffer = np.empty(0, dtype=np.int64)
+        self._positions = {}
+        self.width = None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def rowids(self):
+        return self._positions.keys()
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encodes normalized float32 vectors into the stored row format."""
+        return vectors
+
+    def _distances(self, matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Distance of every row of a block of stored rows to a normalized query."""
+        return 1.0 - matrix @ query
+
+    def add(self, rowids, embeddings: np.ndarray):
+        rows = np.ascontiguousarray(self._encode(normalize_rows(embeddings)), dtype=self.row_dtype)
+        rowids = np.asarray(list(rowids), dtype=np.int64)
+        if not len(rowids):
+            return
+        with self._lock:
+            if self.width is not None and rows.shape[1] != self.width:
+                raise ValueError(f"Embedding row width {rows.shape[1]} does not match index width {self.width}")
+            stale = [rowid for rowid in rowids.tolist() if rowid in self._positions]
+            if stale:
+                self.remove(stale)
+            self._matrix = None  # Release the map before the file grows (required on Windows).
+            with open(self.vectors_file, "ab") as f:
+                f.write(rows.tobytes())
+            with open(self.rowids_file, "ab") as f:
+                f.write(rowids.tobytes())
+            self.width = rows.shape[1]
+            self._append_rowids(rowids)
+            self._map_matrix()
+
+    def _append_rowids(self, rowids: np.ndarray):
+        """Appends to the in-memory rowids, growing their buffer geometrically so ingestion stays linear."""
+        start = len(self._rowids)
+        end = start + len(rowids)
+        if end > len(self._rowid_buffer):
+            buffer = np.empty(max(end, 2 * len(self._rowid_buffer), 1024), dtype=np.int64)
+            buffer[:start] = self._rowids
+            self._rowid_buffer = buffer
+        self._rowid_buffer[start:end] = rowids
+        self._rowids = self._rowid_buffer[:end]
+        self._positions.update(zip(rowids.tolist(), range(start, end)))
+
+    def remove(self, rowids):
+        with self._lock:
+            positions = [self._positions.pop(int(rowid)) for rowid in rowids if int(rowid) in self._positions]
+            if not positions:
+                return
+            self._rowids[positions] = -1
+            # Tombstone just the removed entries in the rowid file.
+            tombstone = np.int64(-1).tobytes()
+            with open(self.rowids_file, "r+b") as f:
+                for position in sorted(positions):
+                    f.seek(position * 8)
+                    f.write(tombstone)
+            deleted = int((self._rowids < 0).sum())
+            if deleted > COMPACT_RATIO * len(self._rowids):
+                self._compact()
+
+    def _compact(self):
+        keep = self._rowids >= 0
+        rows = np.array(self._matrix[keep]) if self._matrix is not None else np.empty((0, 0), self.row_dtype)
+        rowids = self._rowids[keep]
+        self._matrix = None
+        tmp_vectors = self.vectors_file.with_suffix(".tmp")
+        rows.tofile(tmp_vectors)
+        os.replace(tmp_vectors, self.vectors_file)
+        rowids.tofile(self.rowids_file)
+        self._load()
+
+    def clear(self):
+        with self._lock:
+            self._reset_files()
+
+    def _nearest(self, query: np.ndarray, k: int, rowids=None) -> list:
+        """
+        [(rowid, distance)] of the k stored rows with the smallest _distances, closest first.
+        With rowids, only those rows are read from the map and scored.
+        """
+        if self._matrix is None or not self._positions:
+            return []
+        query = normalize_rows(query)[0]
+        if rowids is None:
+            distances = np.asarray(self._distances(self._matrix, query), dtype=np.float32)
+            distances[self._rowids < 0] = np.inf
+            labels = self._rowids
+            k = min(k, len(self._positions))
+        else:
+            # Sorted positions keep the reads from the map sequential.
+            positions = np.sort(np.array([self._positions[rowid] for rowid in rowids if rowid in self._positions],
+                                         dtype=np.int64))
+            if not len(positions):
+                return []
+            distances = np.asarray(self._distances(self._matrix[positions], query), dtype=np.float32)
+            labels = self._rowids[positions]
+            k = min(k, len(positions))
+        return [(int(labels[i]), float(distances[i])) for i in top_k(distances, k)]
+
+    def search(self, query: np.ndarray, limit: int, rowids=None) -> list:
+        self.ensure_synced()
+        with self._lock:
+            return self._nearest(query, limit, rowids)
+
+    def search_many(self, queries: np.ndarray, limit: int, rowids=None) -> list:
+        """Scores all queries against the stored rows as one matrix product."""
+        self.ensure_synced()
+        with self._lock:
+            if self._matrix is None or not self._positions:
+                return [[] for _ in np.atleast_2d(queries)]
+            if rowids is None:
+                matrix, labels = self._matrix, self._rowids
+            else:
+                positions = np.sort(np.array([self._positions[rowid] for rowid in rowids if rowid in self._positions],
+                                             dtype=np.int64))
+                matrix, labels = self._matrix[positions], self._rowids[positions]
+            distances = 1.0 - normalize_rows(queries) @ np.asarray(matrix).T
+            distances[:, labels < 0] = np.inf
+            k = min(limit, int((labels >= 0).sum()))
+            order = top_k_rows(distances, k)
+            return [[(int(labels[i]), float(row[i])) for i in idx] for row, idx in zip(distances, order)]
+
+    def footprint(self) -> dict:
+        """Bytes scanned per query by this index compared with float32 embeddings."""
+        rows = len(self._rowids)
+        index_bytes = self.vectors_file.stat().st_size if self.vectors_file.exists() else 0
+        float32_bytes = rows * self.dimension() * 4 if rows else 0
+        return {
+            "rows": rows,
+            "index_bytes": index_bytes,
+            "float32_bytes": float32_bytes,
+            "reduction": round(float32_bytes / index_bytes, 2) if index_bytes else None
+        }
+
+    def dimension(self):
+        return self.width
+
+# Number of set bits of every byte value, for Hamming distances over packed sign bits.
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+class QuantizedIndex(NumpyMmapIndex):
+    """
+    Coarse search over compact quantized embeddings followed by exact rescoring: the
+    limit * RESCORE_FACTOR best candidates are read from vec_items by rowid and re-ranked
+    by cosine distance at full precision.
+    """
+    block_rows = 65536
+
+    search_many = VectorIndex.search_many
+
+    def search(self, query: np.ndarray, limit: int, rowids=None) -> list:
+        self.ensure_synced()
+        with self._lock:
+            candidates = self._nearest(query, limit * RESCORE_FACTOR, rowids)
+        if not candidates:
+            return []
+        with db_connection(self.db_path) as db:
+            return rescore(db, query, [rowid for rowid, _ in candidates], limit)
+
+class Int8Index(QuantizedIndex):
+    """
+    Scalar int8 quantization: each normalized vector is stored as round(v / scale) with a
+    per-row float32 scale (max |v| / 127) appended as four extra bytes, about 4x smaller than float32.
+    """
+    name = "int8"
+    vectors_filename = "embeddings.i8"
+    row_dtype = np.int8
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        scales = np.abs(vectors).max(axis=1, keepdims=True) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.round(vectors / scales), -127, 127).astype(np.int8)
+        return np.hstack([codes, scales.astype(np.float32).view(np.int8)])
+
+    def _distances(self, matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        dim = self.width - 4
+        scores = np.empty(len(matrix), dtype=np.float32)
+        # Dequantize block by block so a query never materializes the whole matrix as float32.
+        for start in range(0, len(matrix), self.block_rows):
+            block = matrix[start:start + self.block_rows]
+            scales = np.ascontiguousarray(block[:, dim:]).view(np.float32)[:, 0]
+            scores[start:start + len(block)] = (block[:, :dim].astype(np.float32) @ query) * scales
+        return 1.0 - scores
+
+    def dimension(self):
+        return self.width - 4 if self.width else None
+
+class BinaryIndex(QuantizedIndex):
+    """
+    Binary sign quantization: one bit per dimension (32x smaller than float32), searched by
+    Hamming distance before rescoring.
+    """
+    name = "binary"
+    vectors_filename = "embeddings.bits"
+    row_dtype = np.uint8
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(vectors > 0, axis=1)
+
+    def _distances(self, matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        bits = np.packbits(query > 0)
+        distances = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), self.block_rows):
+            block = matrix[start:start + self.block_rows]
+            distances[start:start + len(block)] = _POPCOUNT[np.bitwise_xor(block, bits)].sum(axis=1)
+        return distances
+
+    def dimension(self):
+        return self.width * 8 if self.width else None
+
+class ReducedIndex(QuantizedIndex):
+    """
+    Float32 first pass over embeddings reduced to REDUCED_DIM dimensions, re-ranked at full
+    dimension like the quantized backends. The PCA projection (mean and components) is fitted
+    on search once at least REDUCED_DIM rows exist, refitted as the collection grows, and
+    stored next to the rows; each fit re-encodes the index. Until then the leading dimensions are used.
+    """
+    name = "reduced"
+    vectors_filename = "embeddings.reduced.f32"
+    row_dtype = np.float32
+
+    def __init__(self, db_path: Path, dim: int = REDUCED_DIM, method: str = REDUCED_METHOD):
+        self.reduced_dim = dim
+        self.method = method
+        super().__init__(db_path)
+        self.projection_file = self.index_dir / "projection.npz"
+        self._load_projection()
+        if (self.width is not None and self.width != self.reduced_dim) or \
+                (self.method != "pca" and self.projection_file.exists()):
+            # Built with another MANDIAO_REDUCED_DIM or method; ensure_synced rebuilds it.
+            self.clear()
+
+    def _load_projection(self):
+        self._mean = self._components = None
+        self._fitted_rows = 0  # size of the sample the projection was fitted on
+        if self.method == "pca" and self.projection_file.exists():
+            with np.load(self.projection_file) as projection:
+                if projection["components"].shape[1] == self.reduced_dim:
+                    self._mean, self._components = projection["mean"], projection["components"]
+                    if "rows" in projection.files:
+                        self._fitted_rows = int(projection["rows"])
+
+    def _fit_projection(self):
+        """Fits the PCA projection on (a sample of) the stored embeddings."""
+        if self.method != "pca":
+            return
+        with db_connection(self.db_path) as db:
+            rowids = [row[0] for row in db.execute(
+                "SELECT vec_rowid FROM chunk_index ORDER BY RANDOM() LIMIT ?", (PCA_SAMPLE_ROWS,)
+            ).fetchall()]
+            _, sample = fetch_embeddings(db, rowids)
+        if len(sample) < self.reduced_dim:
+            return
+        sample = normalize_rows(sample)
+        mean = sample.mean(axis=0)
+        _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        self._mean, self._components = mean.astype(np.float32), vt[:self.reduced_dim].T.astype(np.float32)
+        self._fitted_rows = len(sample)
+        np.savez(self.projection_file, mean=self._mean, components=self._components, rows=self._fitted_rows)
+
+    def _ensure_projection(self):
+        """Fits the projection and re-encodes the rows once there are enough rows, or twice as many as last time."""
+        if self.method != "pca":
+            return
+        self.ensure_synced()
+        with self._lock:
+            rows = len(self)
+            if rows < self.reduced_dim:
+                return
+            if self._components is not None and (self._fitted_rows >= PCA_SAMPLE_ROWS or rows <= 2 * self._fitted_rows):
+                return
+            print(f"Fitting the PCA projection of the reduced vector index on {min(rows, PCA_SAMPLE_ROWS)} rows.")
+            self.rebuild()
+
+    def search(self, query: np.ndarray, limit: int, rowids=None) -> list:
+        self._ensure_projection()
+        return super().search(query, limit, rowids)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self._components is not None:
+            reduced = (vectors - self._mean) @ self._components
+        else:
+            reduced = vectors[:, :self.reduced_dim]
+        return normalize_rows(reduced)
+
+    def _distances(self, matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return 1.0 - matrix @ self._encode(query.reshape(1, -1))[0]
+
+    def rebuild(self, batch_size: int = 4096):
+        with self._lock:
+            self.clear()
+            self._fit_projection()
+            self._add_from_vec_items(batch_size)
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._mean = self._components = None
+            self._fitted_rows = 0
+            if self.projection_file.exists():
+                self.projection_file.unlink()
+
+    def dimension(self):
+        with db_connection(self.db_path) as db:
+            return get_vec_dimension(db)
+
+def exact_search(db_path: Path, query: np.ndarray, limit: int, rowids=None) -> list:
+    """Exact [(rowid, cosine distance)] search straight over vec_items, optionally restricted to rowids."""
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    with db_connection(db_path) as db:
+        if rowids is None:
+            return db.execute(
+                "SELECT rowid, vec_distance_cosine(embedding, ?) AS distance FROM vec_items "
+                "ORDER BY distance ASC LIMIT ?",
+                (query.tobytes(), limit)
+            ).fetchall()
+        rowids = list(rowids)
+        if not rowids:
+            return []
+        total = db.execute("SELECT COUNT(*) FROM chunk_index").fetchone()[0]
+        if len(rowids) <= EXACT_LOOKUP_SHARE * total:
+            return rescore(db, query, rowids, limit)
+        # Large scopes: one pass over vec_items, scoring only the allowed rows.
+        allowed = set(rowids)
+        query = normalize_rows(query)[0]
+        best_rowids = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+        cursor = db.execute("SELECT rowid, embedding FROM vec_items")
+        while True:
+            rows = cursor.fetchmany(SCAN_BLOCK_ROWS)
+            if not rows:
+                break
+            rows = [row for row in rows if row[0] in allowed]
+            if not rows:
+                continue
+            block = normalize_rows(np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]))
+            candidates = np.concatenate([best_rowids, np.array([row[0] for row in rows], dtype=np.int64)])
+            distances = np.concatenate([best_distances, 1.0 - block @ query])
+            order = top_k(distances, limit)
+            best_rowids, best_distances = candidates[order], distances[order]
+        return [(int(rowid), float(distance)) for rowid, distance in zip(best_rowids, best_distances)]
+
+class HnswIndex(VectorIndex):
+    """
+    Approximate nearest-neighbour search over an HNSW graph (hnswlib) labelled with vec_items
+    rowids. Inserts from the ingestion path are added incrementally and deletes are marked in
+    the graph. The graph is saved to disk periodically and at exit; after an unclean shutdown
+    only the rows missing from the saved graph are re-added.
+    """
+    name = "hnsw"
+
+    def __init__(self, db_path: Path, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION,
+                 ef_search: int = HNSW_EF_SEARCH, exact_threshold: int = HNSW_EXACT_THRESHOLD):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("The 'hnsw' retrieval backend requires hnswlib: pip install hnswlib")
+        super().__init__(db_path)
+        self._hnswlib = hnswlib
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.exact_threshold = exact_threshold
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.graph_file = self.index_dir / "graph.bin"
+        self.meta_file = self.index_dir / "meta.json"
+        self.labels_file = self.index_dir / "labels.npy"
+        self._graph = None
+        self._labels = set()
+        self._dirty = False
+        self._last_save = 0.0
+        self._load()
+        atexit.register(self.save)
+
+    def _load(self):
+        if not (self.graph_file.exists() and self.meta_file.exists() and self.labels_file.exists()):
+            return
+        try:
+            meta = json.loads(self.meta_file.read_text())
+            graph = self._hnswlib.Index(space="cosine", dim=meta["dim"])
+            graph.load_index(str(self.graph_file), max_elements=meta["max_elements"], allow_replace_deleted=True)
+            self._graph = graph
+            self._labels = set(np.load(self.labels_file).tolist())
+        except Exception as e:
+            print(f"Could not load HNSW index, it will be rebuilt: {e}")
+            self._graph = None
+            self._labels = set()
+
+    def _new_graph(self, dim: int, max_elements: int):
+        graph = self._hnswlib.Index(space="cosine", dim=dim)
+        graph.init_index(max_elements=max_elements, ef_construction=self.ef_construction, M=self.m,
+                         allow_replace_deleted=True)
+        return graph
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def rowids(self):
+        return self._labels
+
+    def add(self, rowids, embeddings: np.ndarray):
+        vectors = normalize_rows(embeddings)
+        labels = np.asarray(list(rowids), dtype=np.int64)
+        with self._lock:
+            if self._graph is None:
+                self._graph = self._new_graph(vectors.shape[1], max(1024, 2 * len(labels)))
+            needed = self._graph.get_current_count() + len(labels)
+            if needed > self._graph.get_max_elements():
+                self._graph.resize_index(max(needed, 2 * self._graph.get_max_elements()))
+            self._graph.add_items(vectors, labels, replace_deleted=True)
+            self._labels.update(labels.tolist())
+            self._changed()
+
+    def remove(self, rowids):
+        with self._lock:
+            for rowid in rowids:
+                if int(rowid) in self._labels:
+                    self._graph.mark_deleted(int(rowid))
+                    self._labels.discard(int(rowid))
+            self._changed()
+
+    def clear(self):
+        with self._lock:
+            self._graph = None
+            self._labels = set()
+            for path in (self.graph_file, self.meta_file, self.labels_file):
+                if path.exists():
+                    path.unlink()
+            self._dirty = False
+
+    def _changed(self):
+        self._dirty = True
+        if time.monotonic() - self._last_save >= HNSW_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or self._graph is None:
+                return
+            self._graph.save_index(str(self.graph_file))
+            np.save(self.labels_file, np.fromiter(self._labels, dtype=np.int64, count=len(self._labels)))
+            self.meta_file.write_text(json.dumps({
+                "dim": self._graph.dim,
+                "max_elements": self._graph.get_max_elements(),
+                "m": self.m,
+                "ef_construction": self.ef_construction
+            }))
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+    def resync(self):
+        """Adds rows missing from the graph and drops labels whose rows no longer exist."""
+        with db_connection(self.db_path) as db:
+            stored = {row[0] for row in db.execute("SELECT vec_rowid FROM chunk_index").fetchall()}
+            missing = sorted(stored - self._labels)
+            for i in range(0, len(missing), 4096):
+                batch = missing[i:i + 4096]
+                rows = [db.execute("SELECT rowid, embedding FROM vec_items WHERE rowid = ?", (rowid,)).fetchone()
+                        for rowid in batch]
+                rows = [row for row in rows if row is not None]
+                if rows:
+                    self.add([row[0] for row in rows],
+                             np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]))
+        extra = self._labels - stored
+        if extra:
+            self.remove(extra)
+        self.save()
+
+    def search(self, query: np.ndarray, limit: int, rowids=None) -> list:
+        self.ensure_synced()
+        if rowids is not None:
+            rowids = [rowid for rowid in rowids if rowid in self._labels]
+        candidates = len(self) if rowids is None else len(rowids)
+        if candidates < self.exact_threshold:
+            return exact_search(self.db_path, query, limit, rowids)
+        with self._lock:
+            k = min(limit, candidates)
+            if k <= 0:
+                return []
+            self._graph.set_ef(max(self.ef_search, k))
+            try:
+                if rowids is None:
+                    labels, distances = self._graph.knn_query(normalize_rows(query), k=k)
+                else:
+                    allowed = set(rowids)
+                    labels, distances = self._graph.knn_query(normalize_rows(query), k=k, num_threads=1,
+                                                              filter=lambda label: label in allowed)
+            except RuntimeError:
+                # hnswlib raises when the walk reaches fewer than k labels, which happens when a
+                # filter leaves allowed rows scattered across the graph.
+                labels = None
+        if labels is None:
+            return exact_search(self.db_path, query, limit, rowids)
+        return [(int(label), float(distance)) for label, distance in zip(labels[0], distances[0])]
+
+    def search_many(self, queries: np.ndarray, limit: int, rowids=None) -> list:
+        queries = np.atleast_2d(queries)
+        self.ensure_synced()
+        if rowids is not None or len(self) < self.exact_threshold:
+            return super().search_many(queries, limit, rowids)
+        with self._lock:
+            k = min(limit, len(self))
+            if k <= 0:
+                return [[] for _ in queries]
+            self._graph.set_ef(max(self.ef_search, k))
+            labels, distances = self._graph.knn_query(normalize_rows(queries), k=k)
+            return [[(int(label), float(distance)) for label, distance in zip(row_labels, row_distances)]
+                    for row_labels, row_distances in zip(labels, distances)]
+
+BACKENDS = {
+    "numpy": NumpyMmapIndex,
+    "hnsw": HnswIndex,
+    "int8": Int8Index,
+    "binary": BinaryIndex,
+    "reduced": ReducedIndex,
+}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_vector_index(db_path: Path = None, backend: str = None):
+    """
+    Returns the secondary index of a database for the configured backend, or None when
+    searches go straight to vec_items ("sqlite").
+    """
+    backend = (backend or RETRIEVAL_BACKEND).lower()
+    if backend == "sqlite":
+        return None
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown retrieval backend '{backend}'. Choose from: sqlite, {', '.join(BACKENDS)}")
+    db_path = Path(db_path) if db_path is not None else get_db_path()
+    key = (str(db_path), backend)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = BACKENDS[backend](db_path)
+        return index
+
+def discard_vector_indexes(db_path: Path):
+    """Forgets the open indexes of a database and deletes their directories (e.g. when it is dropped)."""
+    db_path = Path(db_path)
+    with _indexes_lock:
+        for key in [key for key in _indexes if key[0] == str(db_path)]:
+            index = _indexes.pop(key)
+            if isinstance(index, HnswIndex):
+                atexit.unregister(index.save)
+    for name in BACKENDS:
+        index_dir = db_path.parent / f"{db_path.stem}.{name}"
+        if index_dir.is_dir():
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+class _IndexSync:
+    """Store change listener that mirrors vec_items inserts, deletes and clears into the index."""
+
+    def on_insert(self, db_path, rowids, embeddings):
+        index = get_vector_index(db_path)
+        if index is not None:
+            index.add(rowids, embeddings)
+
+    def on_delete(self, db_path, rowids):
+        index = get_vector_index(db_path)
+        if index is not None:
+            index.remove(rowids)
+
+    def on_clear(self, db_path):
+        index = get_vector_index(db_path)
+        if index is not None:
+            index.clear()
+
+add_change_listener(_IndexSync())
+
+def benchmark_recall(backend: str = "hnsw", k: int = 10, queries: int = 100, db_path: Path = None,
+                     seed: int = 0) -> dict:
+    """
+    Measures recall@k of a backend against exact vec_distance_cosine results, using stored
+    embeddings (sampled with the given seed, so runs are repeatable) as queries, and reports
+    the mean latency of both along with the index's storage footprint where it has one.
+    """
+    db_path = Path(db_path) if db_path is not None else get_db_path()
+    index = get_vector_index(db_path, backend)
+    if index is None:
+        raise ValueError("Pick a backend other than 'sqlite' to compare against exact search.")
+    index.ensure_synced()
+    with db_connection(db_path) as db:
+        stored = [row[0] for row in db.execute("SELECT vec_rowid FROM chunk_index ORDER BY vec_rowid").fetchall()]
+        picked = np.random.default_rng(seed).choice(len(stored), size=min(queries, len(stored)), replace=False)
+        samples = [db.execute("SELECT embedding FROM vec_items WHERE rowid = ?", (stored[i],)).fetchone()
+                   for i in sorted(picked.tolist())]
+    if isinstance(index, HnswIndex):
+        index.exact_threshold = 0  # Always exercise the graph while benchmarking.
+    recalls, exact_times, index_times = [], [], []
+    footprint = index.footprint() if hasattr(index, "footprint") else None
+    for (blob,) in samples:
+        query = np.frombuffer(blob, dtype=np.float32)
+        start = time.perf_counter()
+        exact = {rowid for rowid, _ in exact_search(db_path, query, k)}
+        exact_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        found = {rowid for rowid, _ in index.search(query, k)}
+        index_times.append(time.perf_counter() - start)
+        if exact:
+            recalls.append(len(exact & found) / len(exact))
+    return {
+        "backend": backend,
+        "rows": len(index),
+        "queries": len(recalls),
+        "k": k,
+        "recall_at_k": round(float(np.mean(recalls)), 4) if recalls else None,
+        "exact_ms": round(float(np.mean(exact_times)) * 1000, 3) if exact_times else None,
+        "index_ms": round(float(np.mean(index_times)) * 1000, 3) if index_times else None,
+        "footprint": footprint
+    }
+
+if __name__ == "__main__":
+    # python -m backend.pdf_helper.vector_index --backend hnsw --k 10 --queries 100
+    parser = argparse.ArgumentParser(description="Report recall@k of a vector index against exact search.")
+    parser.add_argument("--backend", default="hnsw", choices=sorted(BACKENDS))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for sampling the query embeddings.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild the index from vec_items first (refits the reduced backend's PCA).")
+    args = parser.parse_args()
+    if args.rebuild:
+        get_vector_index(backend=args.backend).rebuild()
+    print(json.dumps(benchmark_recall(args.backend, k=args.k, queries=args.queries, seed=args.seed), indent=2))
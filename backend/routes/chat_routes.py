@@ -2,7 +2,15 @@
 from flask import Blueprint, jsonify, request, Response
 import json, httpx
 from ..ollama.ollama_manager import OllamaManager
-from ..pdf_helper.retrieval import get_query_embedding, retrieve_relevant_chunks, build_contextual_prompt
+from ..ollama.client import get_client, make_timeout, ollama_url, GENERATE_TIMEOUT
+from ..ollama.models_config import CHAT_MODEL, get_keep_alive
+from ..ollama.scheduler import generation_scheduler
+from ..ollama.chat_sessions import chat_sessions
+from ..pdf_helper.retrieval import (build_contextual_prompt_with_stats, build_followup_prompt,
+                                    peek_query_embedding)
+from ..pdf_helper.shards import resolve_collections, search_collections
+from ..pdf_helper.answer_cache import answer_cache, replay_answer
+from ..pdf_helper.filters import normalize_filters
 
 chat_routes = Blueprint("chat_routes", __name__)
 
@@ -13,26 +21,87 @@ def chat():
     if not user_query:
         return jsonify({"error": "No query provided."}), 400
 
-    # Retrieve context by computing the query embedding and performing the search.
-    query_embedding = get_query_embedding(user_query)
-    chunks = retrieve_relevant_chunks(query_embedding, limit=3)
-    prompt = build_contextual_prompt(user_query, chunks)
+    try:
+        filters = normalize_filters(data.get('filters'))
+        collections = resolve_collections(data.get('collections'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    db_paths = [db_path for _, db_path in collections]
+
+    session_id = data.get('session_id')
+    if session_id is not None and (not isinstance(session_id, str) or not 0 < len(session_id) <= 128):
+        return jsonify({"error": "session_id must be a non-empty string of at most 128 characters."}), 400
+
+    # Retrieve context with the configured mode (vector by default, see MANDIAO_RETRIEVAL_MODE),
+    # searching every requested collection in parallel.
+    chunks = search_collections(user_query, collections, limit=3, filters=filters)
 
     manager = OllamaManager()
-    if not manager.is_model_installed():
+    if not manager.is_model_installed(CHAT_MODEL):
         return jsonify({"error": "Model not installed. Please complete setup first."}), 400
 
-    def generate():
-        payload = {
-            "model": "deepseek-r1:1.5b",
-            "prompt": prompt,
-            "stream": True
-        }
-        try:
-            with httpx.Client(timeout=60.0) as client:
-                with client.stream("POST", "http://localhost:11434/api/generate", json=payload) as response:
+    session, turn, _ = chat_sessions.checkout(session_id, CHAT_MODEL)
+    if session is None:
+        return jsonify({"error": "This chat session is still answering a previous message."}), 409
+
+    # Everything up to the returned Response runs with the session checked out; an error here
+    # must end the turn, or the session would stay busy and refuse every later message.
+    ticket = None
+    try:
+        # A follow-up continues from Ollama's context tokens of the previous turn, so only the new
+        # question and chunks the model has not seen yet are sent. Without a stored context (new
+        # session, or dropped for length) the full prompt is rebuilt with the recent turns.
+        if session.context is not None:
+            new_chunks = [row for row in chunks if row[0] not in session.sent_chunks]
+            prompt, context_stats = build_followup_prompt(user_query, new_chunks)
+        else:
+            prompt, context_stats = build_contextual_prompt_with_stats(user_query, chunks, history=session.history())
+        ollama_context = session.context.tolist() if session.context is not None else None
+
+        # Near-duplicate questions over the same context replay the stored answer. Only the
+        # first turn of a session is cached: later answers depend on the conversation. The lookup
+        # reuses the embedding retrieval computed; questions retrieved without one (lexical fast path)
+        # skip the cache rather than paying an extra embedding call.
+        query_embedding = peek_query_embedding(user_query) if answer_cache.enabled and not session.turns else None
+        if query_embedding is not None:
+            cached_answer = answer_cache.get(CHAT_MODEL, query_embedding, chunks, db_paths)
+            if cached_answer is not None:
+                chat_sessions.checkin(session, turn, user_query, cached_answer)
+                return Response(replay_answer(cached_answer), mimetype='text/plain',
+                                headers={"X-Answer-Cache": "hit", "X-Session-Id": session.id})
+
+        # Generations go through the scheduler: a bounded, per-client round-robin queue in front
+        # of Ollama. The client id is the X-Client-Id header, falling back to the remote address.
+        client_id = request.headers.get("X-Client-Id") or request.remote_addr or "anonymous"
+        ticket = generation_scheduler.try_submit(client_id)
+        if ticket is None:
+            chat_sessions.checkin(session, turn)
+            retry_after = generation_scheduler.retry_after()
+            return jsonify({"error": "Too many chat requests are waiting. Please try again shortly.",
+                            "retryAfter": retry_after}), 429, {"Retry-After": str(retry_after)}
+        queue_position = generation_scheduler.position(ticket)
+
+        def generate():
+            payload = {
+                "model": CHAT_MODEL,
+                "prompt": prompt,
+                "stream": True,
+                "keep_alive": get_keep_alive(CHAT_MODEL)
+            }
+            if ollama_context is not None:
+                payload["context"] = ollama_context
+            answer = []
+            try:
+                if not generation_scheduler.wait(ticket):
+                    yield "Error: Timed out waiting for a free generation slot. Please try again."
+                    return
+                client = get_client()
+                with client.stream("POST", ollama_url("/api/generate"), json=payload,
+                                   timeout=make_timeout(GENERATE_TIMEOUT)) as response:
                     if response.status_code != 200:
-                        error_detail = response.text
+                        error_detail = response.read().decode("utf-8", errors="replace")
                         yield f"Error: Received status {response.status_code}. Details: {error_detail}"
                         return
                     for chunk in response.iter_lines():
@@ -40,14 +109,58 @@ def chat():
                             decoded_chunk = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
                             data_chunk = json.loads(decoded_chunk)
                             if "response" in data_chunk:
+                                answer.append(data_chunk["response"])
                                 yield data_chunk["response"]
                             if data_chunk.get("done", False):
+                                # Only complete generations are cached and become session turns.
+                                full_answer = "".join(answer)
+                                if query_embedding is not None:
+                                    answer_cache.put(CHAT_MODEL, query_embedding, chunks, full_answer, db_paths)
+                                chat_sessions.checkin(session, turn, user_query, full_answer,
+                                                      data_chunk.get("context"), [row[0] for row in chunks])
                                 break
                         except json.JSONDecodeError:
                             continue
-        except httpx.ConnectError:
-            yield "Error: Could not connect to Ollama server. Is it running?"
-        except Exception as e:
-            yield f"Error: {str(e)}"
+            except httpx.ConnectError:
+                yield "Error: Could not connect to Ollama server. Is it running?"
+            except Exception as e:
+                yield f"Error: {str(e)}"
+            finally:
+                generation_scheduler.release(ticket)
+                chat_sessions.checkin(session, turn)
+
+        response = Response(generate(), mimetype='text/plain', headers={
+            "X-Answer-Cache": "miss",
+            "X-Prompt-Tokens-Saved": str(context_stats["tokens_saved"]),
+            "X-Queue-Position": str(queue_position),
+            "X-Session-Id": session.id
+        })
+        # Also frees the ticket and the session if the client disconnects before the stream starts.
+        response.call_on_close(lambda: (generation_scheduler.release(ticket), chat_sessions.checkin(session, turn)))
+        return response
+    except Exception:
+        if ticket is not None:
+            generation_scheduler.release(ticket)
+        chat_sessions.checkin(session, turn)
+        raise
+
+@chat_routes.route("/api/chat/queue", methods=["GET"])
+def chat_queue():
+    """Reports the generation scheduler's slots and queue, and the caller's waiting positions."""
+    client_id = request.headers.get("X-Client-Id") or request.remote_addr or "anonymous"
+    status = generation_scheduler.stats()
+    status["positions"] = generation_scheduler.client_positions(client_id)
+    return jsonify(status)
+
+@chat_routes.route("/api/chat/sessions/<session_id>", methods=["GET"])
+def get_chat_session(session_id):
+    session = chat_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired chat session."}), 404
+    return jsonify(session.to_dict())
 
-    return Response(generate(), mimetype='text/plain')
+@chat_routes.route("/api/chat/sessions/<session_id>", methods=["DELETE"])
+def delete_chat_session(session_id):
+    if not chat_sessions.drop(session_id):
+        return jsonify({"error": "Unknown or expired chat session."}), 404
+    return jsonify({"message": "Chat session deleted."})
@@ -0,0 +1,89 @@
+# backend/routes/retrieval_routes.py
+import os
+from flask import Blueprint, jsonify, request
+from ..pdf_helper.retrieval import get_query_embeddings, build_contextual_prompt_with_stats
+from ..pdf_helper.shards import resolve_collections, search_collections, search_collections_batch
+from ..pdf_helper.filters import normalize_filters
+
+retrieval_routes = Blueprint("retrieval_routes", __name__)
+
+# Upper bound on the number of queries accepted by /api/retrieve/batch.
+MAX_BATCH_QUERIES = int(os.getenv("MANDIAO_MAX_BATCH_QUERIES", "1000"))
+# Upper bound on the chunks returned per query.
+MAX_RETRIEVE_LIMIT = int(os.getenv("MANDIAO_MAX_RETRIEVE_LIMIT", "50"))
+
+def parse_limit(value, default: int = 3) -> int:
+    """Validates a request's limit; raises ValueError unless it is an integer in 1..MAX_RETRIEVE_LIMIT."""
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("limit must be an integer.")
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer.")
+    if not 1 <= limit <= MAX_RETRIEVE_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_RETRIEVE_LIMIT}.")
+    return limit
+
+def chunk_to_dict(row) -> dict:
+    doc_id, text, source, page, distance = row
+    return {"id": doc_id, "text": text, "source": source, "page": page, "distance": distance}
+
+@retrieval_routes.route("/api/retrieve", methods=["POST"])
+def retrieve_api():
+    """
+    Returns the chunks the chat endpoint would use as context, without generating an answer.
+    Expects {"query": ..., "limit": 3, "mode": "vector"|"hybrid"|"lexical", "filters": {...},
+    "collections": ["default", ...]}.
+    """
+    data = request.get_json() or {}
+    query = data.get("query", "")
+    if not query:
+        return jsonify({"error": "No query provided."}), 400
+    try:
+        limit = parse_limit(data.get("limit"))
+        filters = normalize_filters(data.get("filters"))
+        collections = resolve_collections(data.get("collections"))
+        chunks = search_collections(query, collections, limit=limit, mode=data.get("mode"), filters=filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"chunks": [chunk_to_dict(row) for row in chunks]})
+
+@retrieval_routes.route("/api/retrieve/batch", methods=["POST"])
+def retrieve_batch_api():
+    """
+    Vector retrieval for many queries in one call: all queries are embedded with one batched
+    Ollama request and scored against the corpus together.
+    Expects {"queries": [...], "limit": 3, "filters": {...}, "collections": [...], "prompt": false}; with "prompt"
+    set, each result also carries the contextual prompt /api/chat would send and the
+    context builder's token stats.
+    """
+    data = request.get_json() or {}
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q for q in queries):
+        return jsonify({"error": "queries must be a non-empty list of strings."}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch."}), 400
+    try:
+        limit = parse_limit(data.get("limit"))
+        filters = normalize_filters(data.get("filters"))
+        collections = resolve_collections(data.get("collections"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    try:
+        query_embeddings = get_query_embeddings(queries)
+    except Exception as e:
+        return jsonify({"error": f"Embedding failed: {e}"}), 502
+    results = []
+    for query, chunks in zip(queries, search_collections_batch(query_embeddings, collections, limit=limit,
+                                                               filters=filters)):
+        result = {"query": query, "chunks": [chunk_to_dict(row) for row in chunks]}
+        if data.get("prompt"):
+            result["prompt"], result["context"] = build_contextual_prompt_with_stats(query, chunks)
+        results.append(result)
+    return jsonify({"results": results})
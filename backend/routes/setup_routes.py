@@ -3,18 +3,27 @@ import threading
 from flask import Blueprint, jsonify
 from ..ollama.ollama_manager import OllamaManager
 from ..ollama.models_config import MODELS
+from ..ollama.scheduler import generation_scheduler
+from ..ollama.chat_sessions import chat_sessions
+from ..pdf_helper.embed_cache import get_embedding_cache
+from ..pdf_helper.query_cache import query_embedding_cache
+from ..pdf_helper.answer_cache import answer_cache
+from ..pdf_helper.context import context_totals
 
 setup_routes = Blueprint("setup_routes", __name__)
 
 # Global progress storage for the setup task.
-setup_progress = {"stage": None, "progress": 0, "error": None}
+setup_progress = {"stage": None, "progress": 0, "error": None, "pull": None}
 
 def run_setup_task():
     manager = OllamaManager()
 
-    def progress_callback(stage, progress=None):
+    def progress_callback(stage, progress=None, pull=None):
         setup_progress["stage"] = stage
         setup_progress["progress"] = progress
+        if pull is not None:
+            # Byte progress of the model pulls: completed, total, bytesPerSecond, per model.
+            setup_progress["pull"] = pull
 
     try:
         manager.setup_ollama(progress_callback)
@@ -37,6 +46,13 @@ def status():
         "ollamaInstalled": manager.is_ollama_installed(),
         "ollamaRunning": manager.is_ollama_running(),
         "modelsInstalled": models_installed,
+        "modelsLoaded": manager.get_model_load_state(),
         "progress": setup_progress,
-        "error": setup_progress.get("error")
+        "error": setup_progress.get("error"),
+        "embeddingCache": get_embedding_cache().stats(),
+        "queryEmbeddingCache": query_embedding_cache.stats(),
+        "answerCache": answer_cache.stats(),
+        "contextBuilder": context_totals.stats(),
+        "generationQueue": generation_scheduler.stats(),
+        "chatSessions": chat_sessions.stats()
     })
@@ -1,16 +1,16 @@
 # backend/routes/sqlite_routes.py
-import tempfile
 import os
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
-from ..pdf_helper.parse import load_documents, calculate_chunk_ids, split_documents
-from ..pdf_helper.store import add_to_sqlite, clear_sqlite_database
+from ..pdf_helper.jobs import submit_job, get_job_status, list_jobs, find_active_job, get_upload_dir
+from ..pdf_helper.shards import (DEFAULT_COLLECTION, resolve_collections, list_collections, create_collection,
+                                 drop_collection, clear_collection)
 
 sqlite_bp = Blueprint('sqlite', __name__)
 
 @sqlite_bp.route('/upload', methods=['POST'])
 def upload_pdf():
-    """Handle PDF file upload, process it, and store in SQLite."""
+    """Handle PDF file upload and start processing it into SQLite; returns a job id right away."""
     if 'file' not in request.files:
         return jsonify({"status": "error", "message": "No file part"}), 400
     file = request.files['file']
@@ -18,29 +18,92 @@ def upload_pdf():
         return jsonify({"status": "error", "message": "No selected file"}), 400
     if not file.filename.lower().endswith('.pdf'):
         return jsonify({"status": "error", "message": "File must be a PDF"}), 400
+    collection = request.form.get('collection') or DEFAULT_COLLECTION
+    try:
+        resolve_collections(collection)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
     try:
         original_filename = secure_filename(file.filename)
-        temp_file_name = os.path.join(tempfile.gettempdir(), original_filename)
-        file.save(temp_file_name)
-        print(f"Saved uploaded file to: {temp_file_name}")
+        # Uploads are kept in the app data dir (not a temp dir) so the job survives restarts.
+        upload_path = str(get_upload_dir(collection) / original_filename)
+        if find_active_job(upload_path):
+            return jsonify({"status": "error", "message": f"{original_filename} is already being processed"}), 409
+        file.save(upload_path)
+        print(f"Saved uploaded file to: {upload_path}")
     except Exception as e:
         return jsonify({"status": "error", "message": f"Failed to upload file: {str(e)}"}), 500
     try:
-        documents = load_documents(temp_file_name)
-        chunks = split_documents(documents)
-        chunks = calculate_chunk_ids(chunks)
-        add_to_sqlite(chunks)
-        return jsonify({"status": "success", "message": f"Successfully processed PDF: {original_filename}"})
+        # Parsing, splitting, embedding and insertion run as a durable background job;
+        # the job removes the uploaded file once it completes.
+        job_id = submit_job(upload_path, display_name=original_filename, collection=collection)
     except Exception as e:
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
         return jsonify({"status": "error", "message": f"Failed to process file: {str(e)}"}), 500
-    finally:
-        if os.path.exists(temp_file_name):
-            os.remove(temp_file_name)
+    return jsonify({
+        "status": "accepted",
+        "message": f"Processing PDF: {original_filename}",
+        "collection": collection,
+        "job_id": job_id,
+        "progress_url": f"/sqlite/progress/{job_id}"
+    }), 202
+
+@sqlite_bp.route('/progress/<job_id>', methods=['GET'])
+def upload_progress(job_id):
+    """Report the status, pages parsed, chunks embedded and rows written for an upload job."""
+    status = get_job_status(job_id)
+    if status is None:
+        return jsonify({"status": "error", "message": "Unknown job id"}), 404
+    return jsonify(status)
+
+@sqlite_bp.route('/jobs', methods=['GET'])
+def ingestion_jobs():
+    """List recent ingestion jobs with their status."""
+    return jsonify({"jobs": list_jobs()})
 
 @sqlite_bp.route('/clear', methods=['POST'])
 def clear_database():
+    """Clear one collection (the default one unless {"collection": name} is given)."""
+    data = request.get_json(silent=True) or {}
+    collection = data.get('collection') or DEFAULT_COLLECTION
     try:
-        clear_sqlite_database()
-        return jsonify({"status": "success", "message": "Database cleared successfully"})
+        clear_collection(collection)
+        return jsonify({"status": "success", "message": f"Collection {collection} cleared successfully"})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
     except Exception as e:
         return jsonify({"status": "error", "message": f"Failed to clear database: {str(e)}"}), 500
+
+@sqlite_bp.route('/collections', methods=['GET'])
+def collections_list():
+    """List the collections with their chunk and document counts."""
+    return jsonify({"collections": list_collections()})
+
+@sqlite_bp.route('/collections', methods=['POST'])
+def collections_create():
+    """Create an empty collection backed by its own shard file."""
+    data = request.get_json(silent=True) or {}
+    name = data.get('name', '')
+    try:
+        create_collection(name)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except FileExistsError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    return jsonify({"status": "success", "collection": name}), 201
+
+@sqlite_bp.route('/collections/<name>', methods=['DELETE'])
+def collections_drop(name):
+    """Drop a collection and delete its shard file."""
+    try:
+        drop_collection(name)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    return jsonify({"status": "success", "message": f"Collection {name} dropped"})
@@ -3,6 +3,8 @@ from flask import Flask
 from flask_cors import CORS
 from pathlib import Path
 from .pdf_helper.store import initialize_database
+from .pdf_helper.jobs import start_job_workers
+from .ollama.ollama_manager import start_model_preload
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
@@ -10,6 +12,13 @@ CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 # Initialize the SQLite database (creates the vec_items table if needed).
 initialize_database()
 
+# Start the ingestion workers; jobs interrupted by the last shutdown are resumed.
+start_job_workers()
+
+# Load the chat and embedding models into Ollama in the background, so the first chat
+# request does not wait for them.
+start_model_preload()
+
 # Register the blueprint for SQLite upload routes.
 from .routes.sqlite_routes import sqlite_bp
 app.register_blueprint(sqlite_bp, url_prefix="/sqlite")
@@ -18,11 +27,13 @@ app.register_blueprint(sqlite_bp, url_prefix="/sqlite")
 from .routes.setup_routes import setup_routes
 from .routes.embed_routes import embed_routes
 from .routes.chat_routes import chat_routes
+from .routes.retrieval_routes import retrieval_routes
 from .routes.general_routes import general_routes
 
 app.register_blueprint(setup_routes)      # Contains /api/setup and /api/status endpoints.
 app.register_blueprint(embed_routes)      # Contains /api/embed endpoint.
 app.register_blueprint(chat_routes)       # Contains /api/chat endpoint.
+app.register_blueprint(retrieval_routes)  # Contains /api/retrieve endpoint.
 app.register_blueprint(general_routes)    # Contains /health and static file serving endpoints.
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@ import sys
 import threading
 import time
 import socket
+import multiprocessing
 from PyQt6 import QtWidgets
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 from PyQt6.QtCore import QUrl
@@ -58,4 +59,6 @@ def main():
     sys.exit(qt_app.exec())
 
 if __name__ == "__main__":
+    # Required for the PDF parsing process pool in the frozen (PyInstaller) build.
+    multiprocessing.freeze_support()
     main()
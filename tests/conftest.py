@@ -0,0 +1,42 @@
+# tests/conftest.py
+import sqlite3
+import numpy as np
+import pytest
+
+DIM = 32
+
+@pytest.fixture
+def vec_db(tmp_path, monkeypatch):
+    """
+    A fresh ~/.mandiao under tmp_path with an initialized DIM-dimensional database. Skips
+    when this Python's sqlite3 cannot load the sqlite-vec extension.
+    """
+    if not hasattr(sqlite3.Connection, "enable_load_extension"):
+        pytest.skip("this sqlite3 build cannot load extensions")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    from backend.pdf_helper import embed_model
+    from backend.pdf_helper.store import initialize_database, db_connection, get_vec_dimension
+    monkeypatch.setattr(embed_model, "EMBEDDING_DIM", DIM)
+    db_path = tmp_path / ".mandiao" / "mandiao.db"
+    db_path.parent.mkdir(exist_ok=True)
+    initialize_database(db_path)
+    with db_connection(db_path) as db:
+        if get_vec_dimension(db) is None:
+            pytest.skip("sqlite-vec extension is not available")
+    return db_path
+
+def insert_vectors(db_path, vectors: np.ndarray, source: str = "doc.pdf") -> list:
+    """Stores one chunk per vector (ten per page) and returns their vec_items rowids."""
+    from langchain.schema.document import Document
+    from backend.pdf_helper.store import db_connection, write_chunks
+    vectors = np.asarray(vectors, dtype=np.float32)
+    chunks, embeddings = [], {}
+    for i, vector in enumerate(vectors):
+        chunk_id = f"{source}:{i // 10}:{i % 10}"
+        chunks.append(Document(page_content=f"chunk {i}",
+                               metadata={"id": chunk_id, "source": source, "page": i // 10}))
+        embeddings[chunk_id] = vector
+    with db_connection(db_path) as db:
+        write_chunks(db, chunks, embeddings)
+        return [row[0] for row in db.execute("SELECT vec_rowid FROM chunk_index ORDER BY vec_rowid").fetchall()]
@@ -0,0 +1,35 @@
+# tests/test_lexical.py
+import sqlite3
+import pytest
+from backend.pdf_helper.lexical import ensure_fts_table, index_chunk_text, lexical_search
+
+class NoTrigramConnection(sqlite3.Connection):
+    """A connection that behaves like SQLite before 3.34, which has no trigram tokenizer."""
+
+    def execute(self, sql, *args):
+        if "tokenize='trigram'" in sql:
+            raise sqlite3.OperationalError("no such tokenizer: trigram")
+        return super().execute(sql, *args)
+
+@pytest.fixture
+def fts_db():
+    db = sqlite3.connect(":memory:", factory=NoTrigramConnection)
+    try:
+        db.execute("CREATE VIRTUAL TABLE probe USING fts5(text)")
+    except sqlite3.OperationalError:
+        pytest.skip("this sqlite3 build has no FTS5")
+    db.execute("CREATE TABLE vec_items (text TEXT)")
+    db.execute("INSERT INTO vec_items(rowid, text) VALUES (1, 'Pump valve manual'), (2, 'Error code E-204')")
+    db.execute("CREATE TABLE chunk_index (vec_rowid INTEGER PRIMARY KEY, id TEXT, source TEXT, page INTEGER)")
+    db.execute("INSERT INTO chunk_index VALUES (1, 'a.pdf:0:0', 'a.pdf', 0), (2, 'a.pdf:1:0', 'a.pdf', 1), "
+               "(3, 'a.pdf:2:0', 'a.pdf', 2)")
+    yield db
+    db.close()
+
+def test_fts_falls_back_without_trigram(fts_db):
+    ensure_fts_table(fts_db)
+    sql = fts_db.execute("SELECT sql FROM sqlite_master WHERE name = 'chunk_fts'").fetchone()[0]
+    assert "unicode61" in sql
+    index_chunk_text(fts_db, [(3, "Valve replacement steps")])
+    assert [row[0] for row in lexical_search(fts_db, "valve", 5)] == ["a.pdf:0:0", "a.pdf:2:0"]
+    assert [row[0] for row in lexical_search(fts_db, "E-204", 5)] == ["a.pdf:1:0"]
@@ -0,0 +1,111 @@
+# tests/test_pull.py
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from backend.ollama import pull
+from backend.ollama.pull import PullError, PullProgress, pull_model
+
+LAYER_SIZE = 100_000_000
+STEPS = 10
+
+class StubPullHandler(BaseHTTPRequestHandler):
+    """
+    Streams /api/pull progress like Ollama. "flaky" drops the connection halfway through
+    its first attempt, "missing" gets a 404 and "misspelled" a manifest error line.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        model = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["model"]
+        with self.server.lock:
+            self.server.attempts[model] = attempt = self.server.attempts.get(model, 0) + 1
+        if model == "missing":
+            body = b'{"error":"pull model manifest: file does not exist"}'
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._send({"status": "pulling manifest"})
+        if model == "misspelled":
+            self._send({"error": "pull model manifest: file does not exist"})
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        # Ollama resumes a retried pull from the bytes it already has.
+        start = STEPS // 2 if attempt > 1 else 0
+        for step in range(start, STEPS + 1):
+            self._send({"status": "pulling layer", "digest": f"sha256:{model}",
+                        "total": LAYER_SIZE, "completed": step * LAYER_SIZE // STEPS})
+            if model == "flaky" and attempt == 1 and step == STEPS // 2:
+                self.close_connection = True
+                return
+        self._send({"status": "success"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubPullHandler)
+    server.daemon_threads = True
+    server.attempts = {}
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(pull, "ollama_url", lambda path: f"{base_url}/{path.lstrip('/')}")
+    monkeypatch.setattr(pull, "PULL_BACKOFF", 0.01)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_dropped_connection_is_retried(stub_server):
+    seen = []
+    progress = PullProgress(["flaky"], on_change=lambda p: seen.append(p.snapshot()["completed"]))
+    pull_model("flaky", progress, attempts=3)
+    snapshot = progress.snapshot()["models"]["flaky"]
+    assert stub_server.attempts["flaky"] == 2
+    assert snapshot["status"] == "success" and snapshot["attempt"] == 2
+    assert snapshot["completed"] == snapshot["total"] == LAYER_SIZE
+    assert seen == sorted(seen)  # The resumed attempt never moves progress backwards.
+
+@pytest.mark.parametrize("model", ["missing", "misspelled"])
+def test_unknown_model_is_not_retried(stub_server, model):
+    progress = PullProgress([model])
+    with pytest.raises(PullError) as error:
+        pull_model(model, progress, attempts=3)
+    assert not error.value.retryable
+    assert stub_server.attempts[model] == 1
+    assert progress.snapshot()["models"][model]["status"] == "failed"
+
+def test_concurrent_pulls(stub_server):
+    models = ["first", "second"]
+    progress = PullProgress(models)
+    errors = []
+
+    def run(model):
+        try:
+            pull_model(model, progress, attempts=1)
+        except PullError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(model,)) for model in models]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not errors
+    snapshot = progress.snapshot()
+    assert all(snapshot["models"][model]["status"] == "success" for model in models)
+    assert snapshot["completed"] == snapshot["total"] == 2 * LAYER_SIZE
+    assert progress.fraction() == 1.0
@@ -0,0 +1,13 @@
+# tests/test_retrieval_routes.py
+import pytest
+from backend.routes.retrieval_routes import parse_limit, MAX_RETRIEVE_LIMIT
+
+def test_parse_limit_accepts_range():
+    assert parse_limit(None) == 3
+    assert parse_limit(1) == 1
+    assert parse_limit(str(MAX_RETRIEVE_LIMIT)) == MAX_RETRIEVE_LIMIT
+
+@pytest.mark.parametrize("value", [-1, 0, MAX_RETRIEVE_LIMIT + 1, "x", 2.5, True, [3]])
+def test_parse_limit_rejects(value):
+    with pytest.raises(ValueError):
+        parse_limit(value)
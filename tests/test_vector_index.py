@@ -0,0 +1,104 @@
+# tests/test_vector_index.py
+import numpy as np
+import pytest
+from conftest import DIM, insert_vectors
+
+def clustered_vectors(rows: int, clusters: int = 20, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, DIM))
+    return centers[rng.integers(0, clusters, rows)] + 0.3 * rng.standard_normal((rows, DIM))
+
+def test_hnsw_recall(vec_db):
+    pytest.importorskip("hnswlib")
+    from backend.pdf_helper.vector_index import benchmark_recall
+    insert_vectors(vec_db, clustered_vectors(2000))
+    result = benchmark_recall("hnsw", k=10, queries=50, db_path=vec_db, seed=0)
+    assert result["queries"] == 50
+    assert result["recall_at_k"] >= 0.95
+
+class _ShortFilteredWalk:
+    """Graph wrapper that fails filtered queries the way hnswlib 0.8 does when it finds fewer than k labels."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getattr__(self, name):
+        return getattr(self._graph, name)
+
+    def knn_query(self, data, k=1, num_threads=-1, filter=None):
+        if filter is not None:
+            raise RuntimeError("Cannot return the results in a contiguous 2D array. Probably ef or M is too small")
+        return self._graph.knn_query(data, k=k, num_threads=num_threads)
+
+def test_hnsw_filtered_search_falls_back_to_exact(vec_db):
+    pytest.importorskip("hnswlib")
+    from backend.pdf_helper.vector_index import HnswIndex, exact_search
+    rowids = insert_vectors(vec_db, clustered_vectors(2000))
+    index = HnswIndex(vec_db, exact_threshold=0)
+    index.ensure_synced()
+    index._graph = _ShortFilteredWalk(index._graph)
+    query = clustered_vectors(1, seed=1)[0]
+    allowed = rowids[::397]
+    expected = exact_search(vec_db, query, 10, allowed)
+    assert len(expected) == len(allowed)
+    assert index.search(query, 10, allowed) == expected
+
+@pytest.mark.parametrize("backend", ["int8", "binary", "reduced"])
+def test_quantized_rescoring_is_exact(vec_db, backend):
+    from backend.pdf_helper.vector_index import BACKENDS, ReducedIndex, exact_search
+    insert_vectors(vec_db, clustered_vectors(1000))
+    index = ReducedIndex(vec_db, dim=16) if backend == "reduced" else BACKENDS[backend](vec_db)
+    query = clustered_vectors(1, seed=2)[0]
+    found = index.search(query, 5)
+    # Rescored distances are the full-precision ones, in ascending order.
+    rescored = exact_search(vec_db, query, 5, [rowid for rowid, _ in found])
+    assert [rowid for rowid, _ in found] == [rowid for rowid, _ in rescored]
+    assert np.allclose([d for _, d in found], [d for _, d in rescored], atol=1e-5)
+    if backend != "binary":  # 32 sign bits are too coarse to promise the exact top 5.
+        assert [rowid for rowid, _ in found] == [rowid for rowid, _ in exact_search(vec_db, query, 5)]
+
+@pytest.mark.parametrize("share", [0.01, 0.5])
+def test_scoped_exact_search(vec_db, share):
+    from backend.pdf_helper.vector_index import exact_search, normalize_rows
+    vectors = clustered_vectors(1000)
+    rowids = insert_vectors(vec_db, vectors)
+    # 1% of the rows are read by rowid, half of them with a single scan.
+    allowed = rowids[::int(1 / share)]
+    query = clustered_vectors(1, seed=3)[0]
+    distances = 1.0 - normalize_rows(vectors) @ normalize_rows(query)[0]
+    positions = [rowids.index(rowid) for rowid in allowed]
+    expected = sorted(positions, key=lambda i: distances[i])[:5]
+    found = exact_search(vec_db, query, 5, allowed)
+    assert [rowid for rowid, _ in found] == [rowids[i] for i in expected]
+    assert np.allclose([d for _, d in found], distances[expected], atol=1e-5)
+
+def test_replaced_rows_resync_numpy_index(vec_db):
+    from backend.pdf_helper.store import db_connection, delete_page_chunks
+    from backend.pdf_helper.vector_index import NumpyMmapIndex
+    old_rowids = insert_vectors(vec_db, clustered_vectors(100))
+    NumpyMmapIndex(vec_db).ensure_synced()
+    # Replace the last page behind the index's back, as a crash or another process would.
+    with db_connection(vec_db) as db:
+        delete_page_chunks(db, "doc.pdf", [9])
+        db.commit()
+    replacement = clustered_vectors(10, seed=4)
+    new_rowids = sorted(set(insert_vectors(vec_db, replacement, source="new.pdf")) - set(old_rowids))
+    assert len(new_rowids) == 10
+    assert min(new_rowids) > max(old_rowids)  # Rowids are never reused.
+    found = NumpyMmapIndex(vec_db).search(replacement[0], 1)
+    assert found[0][0] == new_rowids[0]
+    assert found[0][1] < 1e-5
+
+def test_reduced_index_fits_projection_on_listener_inserts(vec_db):
+    from backend.pdf_helper.vector_index import ReducedIndex, exact_search
+    index = ReducedIndex(vec_db, dim=16)
+    index.ensure_synced()  # Fresh install: nothing to rebuild, so nothing is fitted yet.
+    vectors = clustered_vectors(500)
+    rowids = insert_vectors(vec_db, vectors)
+    index.add(rowids, vectors)  # What the change listener does on insert.
+    assert index._components is None
+    query = vectors[123] + 0.05 * np.random.default_rng(5).standard_normal(DIM)
+    found = index.search(query, 5)
+    assert index._components is not None and index._fitted_rows == 500
+    assert [rowid for rowid, _ in found] == [rowid for rowid, _ in exact_search(vec_db, query, 5)]
+    assert ReducedIndex(vec_db, dim=16)._fitted_rows == 500  # The projection is stored with the rows.